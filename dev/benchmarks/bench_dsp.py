@@ -0,0 +1,74 @@
+"""
+Compares the NumPy sentence assembly (dsp.py) with the former pydub path: time, allocated memory and
+number of allocations per sentence. The pydub part is skipped if pydub is not installed.
+Run from the repository root: python dev/benchmarks/bench_dsp.py [sentence seconds] [sample rate]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath("lfffxivtts"))
+
+from dsp import assemble_sentence
+
+REPETITIONS = 200
+
+
+def assemble_pydub(wav_bytes, sample_rate):
+    import io
+    from pydub import AudioSegment
+    segment = AudioSegment.from_raw(io.BytesIO(wav_bytes), frame_rate=sample_rate, sample_width=2, channels=1)
+    try:
+        new_segment = segment.fade_out(100) + AudioSegment.silent(duration=150, frame_rate=sample_rate)
+    except:
+        new_segment = segment + AudioSegment.silent(duration=150, frame_rate=sample_rate)
+    return np.array(new_segment.get_array_of_samples(), dtype=np.float32) / 32768.0
+
+
+def assemble_numpy(wav_bytes, sample_rate):
+    return assemble_sentence(wav_bytes, sample_rate, fade_duration=0.1, silence_duration=0.15)
+
+
+def measure(name, assemble, wav_bytes, sample_rate):
+    assemble(wav_bytes, sample_rate)  # Warm-up
+    start = time.perf_counter()
+    for _ in range(REPETITIONS):
+        assemble(wav_bytes, sample_rate)
+    duration = (time.perf_counter() - start) / REPETITIONS
+
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    result = assemble(wav_bytes, sample_rate)
+    snapshot_after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocations = sum(stat.count_diff for stat in snapshot_after.compare_to(snapshot_before, "lineno")
+                      if stat.count_diff > 0)
+    print(f"{name:<8} {duration * 1000:8.3f} ms  peak {peak / 1024:8.1f} KB  allocations {allocations:5d}")
+    return result
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    sample_rate = int(sys.argv[2]) if len(sys.argv) > 2 else 22050
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    wav_bytes = (np.sin(2 * np.pi * 220 * t) * 16000).astype(np.int16).tobytes()
+    print("Sentence:", seconds, "seconds at", sample_rate, "Hz")
+
+    reference = None
+    try:
+        import pydub  # noqa: F401
+        reference = measure("pydub", assemble_pydub, wav_bytes, sample_rate)
+    except ImportError:
+        print("pydub    (not installed)")
+    result = measure("numpy", assemble_numpy, wav_bytes, sample_rate)
+    if reference is not None:
+        print("Length difference:", len(result) - len(reference), "samples, max deviation:",
+              float(np.max(np.abs(result[:len(reference)] - reference[:len(result)]))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+End-to-end benchmark: starts a local websocket server that replays a trace of plugin messages (Say/Cancel),
+runs the websocket client against it with a null audio sink and reports time to first audio, per-stage latency,
+throughput and cancellation latency as JSON.
+
+Traces are JSON lines {"time": <seconds since start>, "message": <plugin message>}.
+Run from the repository root:
+  python dev/benchmarks/bench_e2e.py [--trace trace.jsonl | --generate N] [--fake] [--output report.json]
+  python dev/benchmarks/bench_e2e.py --record trace.jsonl [--uri ws://localhost:8081/Messages]
+
+Options:
+  --trace FILE        replay a recorded trace
+  --generate N        replay a generated trace with N Say messages (default 20, some are cancelled)
+  --seed N            seed of the generated trace
+  --fake              use a fake piper voice (no models required)
+  --fake-rtf X        real-time factor of the fake voice (default 0.1)
+  --sink-speed X      the null sink "plays" X times faster than real time (default 1)
+  --mode MODE         dialogue mode (interrupt, queue, latest)
+  --cache             keep the audio cache enabled (disabled by default, so every line is synthesized)
+  --output FILE       also write the report to a file
+  --verbose           show the client log
+  --record FILE       connect to the plugin and record its messages into a trace until interrupted
+  --uri URI           websocket URI of the plugin (record mode)
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath("lfffxivtts"))
+
+LINES = [
+    "Well met, adventurer.",
+    "The road to Ul'dah is long and dangerous, so take care. I have heard rumors of bandits near the crossroads.",
+    "Thank you!",
+    "Have you seen the Scions? They were here a moment ago. I believe they went north, towards the city gates.",
+    "Hm? What is it?",
+    "We must hurry. The ceremony begins at dusk, and the Lord Commander will not wait for us.",
+    "I... I cannot thank you enough. Please, take this as a token of my gratitude.",
+    "Stay your blade!",
+]
+SPEAKERS = [("Alphinaud", 1008175), ("Alisaie", 1008176), ("Merchant", 0), ("Guard", 0), ("Tataru", 1008177)]
+
+
+class FakePiperVoice:
+    """
+    Stands in for piper.PiperVoice: characters are "phonemes", inference takes rtf * audio duration
+    """
+    SECONDS_PER_PHONEME = 0.06
+
+    class Config:
+        sample_rate = 22050
+        num_speakers = 1000
+        noise_scale = 0.667
+        length_scale = 1.0
+        noise_w = 0.8
+        espeak_voice = "en-us"
+        phoneme_id_map = {"_": [0], "^": [1], "$": [2]}
+
+    def __init__(self, rtf):
+        self.config = FakePiperVoice.Config()
+        self.rtf = rtf
+
+    def phonemize(self, text):
+        return [list(sentence) for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence]
+
+    def phonemes_to_ids(self, phonemes):
+        return [1] + [0 for _ in phonemes] + [2]
+
+    def synthesize_stream_raw(self, text, phoneme_input=True, speaker_id=None, length_scale=None, noise_scale=None,
+                              noise_w=None, sentence_silence=0.2):
+        duration = len(text) * FakePiperVoice.SECONDS_PER_PHONEME
+        time.sleep(duration * self.rtf)
+        # Trailing word boundaries (short-utterance padding) cost inference but render no audio
+        duration = len(text.rstrip(" ")) * FakePiperVoice.SECONDS_PER_PHONEME
+        t = np.arange(int(duration * self.config.sample_rate)) / self.config.sample_rate
+        audio = (np.sin(2 * np.pi * 180 * t) * 12000).astype(np.int16)
+        yield audio.tobytes() + bytes(int(sentence_silence * self.config.sample_rate) * 2)
+
+
+def use_fake_voice(rtf):
+    """
+    Replaces model loading by FakePiperVoice (the model files are empty placeholders in a temporary directory)
+    """
+    import models
+    import tts
+    directory = tempfile.mkdtemp(prefix="lfffxivtts_fake_models_")
+
+    def fake_model_files(model, language, variant=""):
+        base = os.path.join(directory, model + "_" + language)
+        model_file = base + ("." + variant if variant else "") + ".onnx"
+        for path in [model_file, base + ".json"]:
+            if not os.path.exists(path):
+                open(path, "wb").close()
+        return model_file, base + ".json"
+
+    models.model_files = fake_model_files
+    models.load_piper_voice = lambda model_file, config_file, settings=None, cache_directory="": FakePiperVoice(rtf)
+
+
+def generate_trace(count, seed):
+    """
+    :return: list of trace entries; every fifth line is cancelled shortly after it was sent
+    """
+    rng = random.Random(seed)
+    trace = []
+    now = 0.5
+    for index in range(count):
+        speaker, npc_id = rng.choice(SPEAKERS)
+        trace.append({"time": round(now, 3), "message": {"Type": "Say", "Payload": rng.choice(LINES),
+                                                         "Speaker": speaker, "NpcId": npc_id,
+                                                         "Language": "English"}})
+        if index % 5 == 4:
+            now += rng.uniform(0.3, 1.0)
+            trace.append({"time": round(now, 3), "message": {"Type": "Cancel"}})
+        now += rng.uniform(1.0, 4.0)
+    return trace
+
+
+def read_trace(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def record_trace(uri, path):
+    import websockets
+    start = time.time()
+    count = 0
+    print("Recording", uri, "into", path, "(Ctrl+C to stop)")
+    async with websockets.connect(uri) as websocket:
+        with open(path, "a", encoding="utf-8") as f:
+            while True:
+                message = json.loads(await websocket.recv())
+                f.write(json.dumps({"time": round(time.time() - start, 3), "message": message}) + "\n")
+                f.flush()
+                count += 1
+                print("Recorded", count, "messages")
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    values = np.array(values, dtype=np.float64)
+    return {"count": int(len(values)), "mean": float(values.mean()), "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)), "max": float(values.max())}
+
+
+async def replay(config, trace):
+    """
+    Replays the trace against the websocket client
+    :return: (measurements name -> list of values, wall time)
+    """
+    import websockets
+    import client
+    import metrics
+
+    measurements = {}
+    in_flight = [0]
+
+    def listener(name, value, labels):
+        measurements.setdefault(name, []).append(value)
+
+    metrics.add_listener(listener)
+    tts_say = client.tts_say
+
+    def counting_tts_say(config, message, generation, utterance):
+        in_flight[0] += 1
+        try:
+            tts_say(config, message, generation, utterance)
+        finally:
+            in_flight[0] -= 1
+
+    client.tts_say = counting_tts_say
+    replay_done = asyncio.Event()
+
+    async def serve(websocket):
+        start = time.time()
+        for entry in trace:
+            await asyncio.sleep(max(0.0, start + entry["time"] - time.time()))
+            await websocket.send(json.dumps(entry["message"]))
+        replay_done.set()
+        await websocket.wait_closed()
+
+    async with websockets.serve(serve, "localhost", 0) as server:
+        config["websocketURI"] = "ws://localhost:" + str(server.sockets[0].getsockname()[1])
+        start = time.time()
+        client_task = asyncio.create_task(client.start_client_(config))
+        await replay_done.wait()
+        idle_since = None
+        while True:
+            idle = in_flight[0] == 0 and not client.SCHEDULER.pending and client.SCHEDULER.ahead() == 0
+            if not idle:
+                idle_since = None
+            elif idle_since is None:
+                idle_since = time.time()
+            elif time.time() - idle_since > 0.5:
+                break
+            await asyncio.sleep(0.05)
+        wall_time = time.time() - start - 0.5
+        client_task.cancel()
+    metrics.remove_listener(listener)
+    client.tts_say = tts_say
+    return measurements, wall_time
+
+
+def main():
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            return args[args.index(name) + 1]
+        return default
+
+    if "--record" in args:
+        asyncio.run(record_trace(option("--uri", "ws://localhost:8081/Messages"), option("--record")))
+        return
+
+    if "--fake" in args:
+        use_fake_voice(float(option("--fake-rtf", 0.1)))
+    trace = read_trace(option("--trace")) if option("--trace") else generate_trace(int(option("--generate", 20)),
+                                                                                    int(option("--seed", 0)))
+
+    import client
+    import tts
+    from config import read_config
+
+    log = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if "--verbose" in args else log):
+        config = read_config()
+        config["enable"] = True
+        config["tts"]["audioSink"] = "null"
+        config["tts"]["nullSinkSpeed"] = float(option("--sink-speed", 1.0))
+        config["tts"]["debugExportDirectory"] = ""
+        if "--cache" not in args:
+            config["tts"]["audioCache"] = {"enable": False}
+        if "--fake" in args:
+            config["tts"]["batchInference"] = False
+        if option("--mode"):
+            config["dialogue"]["mode"] = option("--mode")
+        tts.tts_init(config)
+        tts.PIPER_MODELS.preload(config, wait=True)
+        client.start_audio_worker()
+        measurements, wall_time = asyncio.run(replay(config, trace))
+
+    audio_seconds = sum(measurements.get("audio_seconds", []))
+    synthesis_seconds = sum(measurements.get("inference", []))
+    says = sum(1 for entry in trace if entry["message"].get("Type") == "Say")
+    report = {
+        "trace": {"messages": len(trace), "say": says, "cancel": len(trace) - says,
+                  "dialogueMode": config["dialogue"]["mode"], "fakeVoice": "--fake" in args},
+        "timeToFirstAudio": summarize(measurements.get("time_to_first_audio", [])),
+        "stages": {name: summarize(measurements.get(name, []))
+                   for name in ["queue_wait", "voice_selection", "model_fetch", "phonemize", "inference", "post_process",
+                                "first_sentence", "sentence", "synthesis"]},
+        "throughput": {
+            "wallTime": wall_time,
+            "linesPlayed": len(measurements.get("lines_played", [])),
+            "linesPerMinute": len(measurements.get("lines_played", [])) / wall_time * 60 if wall_time else 0,
+            "audioSeconds": audio_seconds,
+            "synthesisSeconds": synthesis_seconds,
+            "realTimeFactor": synthesis_seconds / audio_seconds if audio_seconds else None
+        },
+        "cancellation": {stage: summarize(measurements.get("cancel_latency_" + stage, []))
+                         for stage in ["synthesis", "playback"]}
+    }
+    print(json.dumps(report, indent=4))
+    if option("--output"):
+        with open(option("--output"), "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares the short-utterance strategies (modelConfig shortUtteranceMode) for models with a minPhonemeCount:
+inference time, number of synthesized phonemes, output length, number of audio chunks (group merges sentences
+into one chunk) and the time until the first chunk of a line.
+Run from the repository root: python dev/benchmarks/bench_short_utterance.py [--fake] [model_lang] [speaker]
+With --fake, the fake voice of bench_e2e.py stands in for the model (compute cost scales with the phonemes).
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath("lfffxivtts"))
+
+from config import read_config
+from tts import run_piper, PIPER_MODELS
+
+LINES = {
+    "de": ["Ja.", "Nein!", "Danke.", "Wie bitte?", "Hallo. Na? Gut.", "Komm mit. Schnell!", "Was ist los? Sag schon.",
+           "Abenteurer! Wir brauchen Eure Hilfe."],
+    "fr": ["Oui.", "Non !", "Merci.", "Pardon ?", "Salut. Ça va ? Bien.", "Viens. Vite !", "Aventurier ! Aidez-nous."],
+    "en": ["Yes.", "No!", "Thanks.", "Pardon?", "Hello. Well? Good.", "Come. Quickly!", "Adventurer! We need help."],
+}
+
+
+def main():
+    args = sys.argv[1:]
+    if "--fake" in args:
+        args.remove("--fake")
+        from bench_e2e import use_fake_voice
+        use_fake_voice(0.1)
+    model_lang = args[0] if len(args) > 0 else "mls_de"
+    speaker = args[1] if len(args) > 1 else "0"
+    model, language = model_lang.split("_")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = read_config()
+    config["tts"]["audioCache"] = {"enable": False}
+    # Every inference goes through synthesize_stream_raw, where it is counted
+    config["tts"]["batchInference"] = False
+    model_config = config["tts"]["modelConfig"].setdefault(model_lang, {})
+    model_config.setdefault("minPhonemeCount", 80)
+
+    voice = PIPER_MODELS.get(model, language)
+    synthesize_stream_raw = voice.synthesize_stream_raw
+    counters = {"phonemes": 0, "inference": 0.0}
+
+    def counting_synthesize(text, **kwargs):
+        start = time.perf_counter()
+        chunks = list(synthesize_stream_raw(text, **kwargs))
+        counters["inference"] += time.perf_counter() - start
+        counters["phonemes"] += len(text)
+        return chunks
+
+    voice.synthesize_stream_raw = counting_synthesize
+    # Warm-up
+    with contextlib.redirect_stdout(io.StringIO()):
+        list(run_piper(config, "Hallo.", model, language, speaker))
+
+    results = {}
+    for mode in ["repeat", "pad", "group"]:
+        model_config["shortUtteranceMode"] = mode
+        counters["phonemes"] = 0
+        counters["inference"] = 0.0
+        audio_seconds = 0.0
+        chunks = 0
+        first_chunk = 0.0
+        lines = LINES.get(language, LINES["en"])
+        with contextlib.redirect_stdout(io.StringIO()):
+            for line in lines:
+                start = time.perf_counter()
+                for index, (audio, sample_rate) in enumerate(run_piper(config, line, model, language, speaker)):
+                    if index == 0:
+                        first_chunk += time.perf_counter() - start
+                    audio_seconds += len(audio) / sample_rate
+                    chunks += 1
+        results[mode] = {
+            "inferenceSeconds": round(counters["inference"], 3),
+            "synthesizedPhonemes": counters["phonemes"],
+            "outputSeconds": round(audio_seconds, 2),
+            "chunks": chunks,
+            "meanFirstChunkSeconds": round(first_chunk / len(lines), 3)
+        }
+    print(json.dumps({"model": model_lang, "speaker": speaker,
+                      "minPhonemeCount": model_config["minPhonemeCount"], "results": results}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
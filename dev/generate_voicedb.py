@@ -0,0 +1,233 @@
+"""
+Generates the voice database: matches the reference recordings of the FFXIV characters to the most similar TTS voice
+of the same gender and writes lfffxivtts/resources/characters.json and lfffxivtts/resources/voices.json.
+
+Features (MFCC and average pitch) are extracted in a process pool and cached per file content in
+cache/voice_features, so only new or changed recordings are processed again.
+Entries of languages that are not processed are kept.
+
+Run from the repository root:
+  python dev/generate_voicedb.py [--languages de,en,fr] [--method mfcc|pitch] [--workers N]
+
+Options:
+  --languages LIST    comma-separated languages (default de,en,fr)
+  --method METHOD     similarity of the voices: mfcc (default) or pitch
+  --workers N         feature extraction processes (default: one per core)
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+VOICES_DIRECTORY = "dev/voices"
+RESOURCES_DIRECTORY = "lfffxivtts/resources"
+FEATURE_CACHE_DIRECTORY = "cache/voice_features"
+# Normalized sample rate of the MFCC extraction
+SAMPLE_RATE = 44100
+N_MFCC = 13
+# Part of the cache key, increment when the extraction changes
+FEATURE_VERSION = 1
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(block)
+    sha1.update(json.dumps([FEATURE_VERSION, SAMPLE_RATE, N_MFCC]).encode("utf-8"))
+    return sha1.hexdigest()
+
+
+def extract_features(path):
+    """
+    Extracts the features of a recording (runs in a worker process)
+    :param path: the WAV file
+    :return: (mfcc [N_MFCC x frames], average pitch in Hz)
+    """
+    import librosa
+    y, _ = librosa.load(path, sr=SAMPLE_RATE)
+    mfcc = librosa.feature.mfcc(y=y, sr=SAMPLE_RATE, n_mfcc=N_MFCC)
+    y, sr = librosa.load(path)
+    pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
+    # Pitch of the strongest bin per frame
+    pitch = float(np.mean(pitches[magnitudes.argmax(axis=0), np.arange(pitches.shape[1])]))
+    return mfcc.astype(np.float32), pitch
+
+
+def cached_extract_features(path, digest):
+    mfcc, pitch = extract_features(path)
+    np.savez(os.path.join(FEATURE_CACHE_DIRECTORY, digest + ".tmp.npz"), mfcc=mfcc, pitch=pitch)
+    os.replace(os.path.join(FEATURE_CACHE_DIRECTORY, digest + ".tmp.npz"),
+               os.path.join(FEATURE_CACHE_DIRECTORY, digest + ".npz"))
+    return mfcc, pitch
+
+
+def load_features(paths, workers):
+    """
+    Returns the features of the recordings, extracting only those that are not cached
+    :param paths: WAV files
+    :param workers: number of worker processes (0: one per core)
+    :return: dict path -> (mfcc, pitch)
+    """
+    os.makedirs(FEATURE_CACHE_DIRECTORY, exist_ok=True)
+    features = {}
+    missing = []
+    for path in paths:
+        digest = file_hash(path)
+        cache_file = os.path.join(FEATURE_CACHE_DIRECTORY, digest + ".npz")
+        if os.path.exists(cache_file):
+            with np.load(cache_file) as cached:
+                features[path] = (cached["mfcc"], float(cached["pitch"]))
+        else:
+            missing.append((path, digest))
+    print("[i]", len(features), "recordings cached,", len(missing), "to extract")
+    if missing:
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            results = executor.map(cached_extract_features, [path for path, _ in missing],
+                                   [digest for _, digest in missing])
+            for (path, _), result in zip(missing, results):
+                features[path] = result
+        print("[i] Extracted", len(missing), "recordings in", round(time.time() - start, 1), "seconds")
+    return features
+
+
+def read_voices(directory, fields):
+    """
+    :param directory: directory with WAV files named <field 1>_<field 2>_..._<field n>.wav
+    :param fields: the names of the fields
+    :return: list of dicts with the fields, "name" (file name without extension) and "path"
+    """
+    voices = []
+    if not os.path.isdir(directory):
+        return voices
+    for file in sorted(os.listdir(directory)):
+        if not file.endswith(".wav"):
+            continue
+        name = file[:-4]
+        voice = dict(zip(fields, name.split("_")))
+        voice["name"] = name
+        voice["path"] = os.path.join(directory, file)
+        voices.append(voice)
+    return voices
+
+
+def read_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def mfcc_distances(references, voices):
+    """
+    Distances of all references to all voices at once. Like comparing each reference with every voice padded
+    (with zeros) or truncated to the length of the reference: ||reference - voice[:, :len(reference)]||.
+    :param references: list of MFCC matrices [N_MFCC x frames]
+    :param voices: list of MFCC matrices [N_MFCC x frames]
+    :return: matrix [references x voices]
+    """
+    frames = max(mfcc.shape[1] for mfcc in references)
+
+    def stack(mfccs):
+        stacked = np.zeros((len(mfccs), N_MFCC, frames), dtype=np.float64)
+        for i, mfcc in enumerate(mfccs):
+            stacked[i, :, :min(frames, mfcc.shape[1])] = mfcc[:, :frames]
+        return stacked
+
+    reference_mfcc = stack(references)
+    voice_mfcc = stack(voices)
+    mask = np.arange(frames)[None, :] < np.array([mfcc.shape[1] for mfcc in references])[:, None]
+    squared = ((reference_mfcc ** 2).sum(axis=(1, 2))[:, None]
+               - 2 * np.einsum("ift,jft->ij", reference_mfcc, voice_mfcc)
+               + mask @ (voice_mfcc ** 2).sum(axis=1).T)
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def match_voices(references, voices, features, method):
+    """
+    Assigns the most similar TTS voice of the same gender to every reference
+    :param references: reference recordings of a language
+    :param voices: TTS voices of the language
+    :param features: dict path -> (mfcc, pitch)
+    :param method: "mfcc" or "pitch"
+    :return: dict reference name -> TTS voice
+    """
+    matches = {}
+    for gender in sorted(set(reference["gender"] for reference in references)):
+        gender_references = [reference for reference in references if reference["gender"] == gender]
+        gender_voices = [voice for voice in voices if voice["gender"] == gender]
+        if not gender_voices:
+            print("[w] No", gender, "TTS voice for", len(gender_references), "references")
+            continue
+        if method == "pitch":
+            distances = np.abs(np.array([features[reference["path"]][1] for reference in gender_references])[:, None]
+                               - np.array([features[voice["path"]][1] for voice in gender_voices])[None, :])
+        else:
+            distances = mfcc_distances([features[reference["path"]][0] for reference in gender_references],
+                                       [features[voice["path"]][0] for voice in gender_voices])
+        for reference, best in zip(gender_references, distances.argmin(axis=1)):
+            matches[reference["character"]] = gender_voices[best]
+    return matches
+
+
+def main():
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        if name in args:
+            return args[args.index(name) + 1]
+        return default
+
+    languages = option("--languages", "de,en,fr").split(",")
+    method = option("--method", "mfcc")
+    if method not in ["mfcc", "pitch"]:
+        print(__doc__)
+        return
+
+    references = {}
+    voices = {}
+    for lang in languages:
+        references[lang] = read_voices(os.path.join(VOICES_DIRECTORY, "references", lang), ["character", "gender"])
+        voices[lang] = read_voices(os.path.join(VOICES_DIRECTORY, "tts", lang),
+                                   ["model", "language", "speaker", "gender"])
+        print("[i]", lang + ":", len(references[lang]), "references,", len(voices[lang]), "TTS voices")
+    features = load_features([voice["path"] for lang in languages for voice in references[lang] + voices[lang]],
+                             int(option("--workers", 0)))
+
+    # Languages that are not processed keep their entries
+    characters = read_json(os.path.join(RESOURCES_DIRECTORY, "characters.json"))
+    for character in characters.values():
+        for lang in languages:
+            character["tts"].pop(lang, None)
+    for lang in languages:
+        matches = match_voices(references[lang], voices[lang], features, method)
+        for reference in references[lang]:
+            if reference["character"] not in matches:
+                continue
+            character = characters.setdefault(reference["character"], {"name": reference["character"],
+                                                                         "gender": reference["gender"], "tts": {}})
+            tts = matches[reference["character"]]
+            character["tts"][lang] = {"model": tts["model"], "language": lang, "speaker": tts["speaker"]}
+    characters = {name: character for name, character in characters.items() if character["tts"]}
+    with open(os.path.join(RESOURCES_DIRECTORY, "characters.json"), "w") as f:
+        json.dump(characters, f, indent=4)
+
+    from natsort import natsorted
+    voice_db = read_json(os.path.join(RESOURCES_DIRECTORY, "voices.json"))
+    for lang in languages:
+        voice_db[lang] = natsorted([{"name": voice["name"], "model": voice["model"], "language": lang,
+                                     "gender": voice["gender"], "speaker": voice["speaker"]} for voice in voices[lang]],
+                                   key=lambda voice: voice["name"])
+    with open(os.path.join(RESOURCES_DIRECTORY, "voices.json"), "w") as f:
+        json.dump(voice_db, f, indent=4)
+    print("[i] Wrote", len(characters), "characters and", sum(len(lang_voices) for lang_voices in voice_db.values()),
+          "TTS voices to", RESOURCES_DIRECTORY)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def make_cache_key(**parts):
+    """
+    Builds a content-addressed key from the synthesis inputs
+    :param parts: everything that influences the synthesized audio (model, speaker, phonemes, parameters, ...)
+    :return: hex digest
+    """
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    On-disk cache of synthesized sentences (raw mono 16-bit PCM as returned by piper).
+    Files are stored as <directory>/<key[:2]>/<key>.pcm. The file modification time is used as
+    last access time, so the LRU order survives restarts.
+    """
+
+    def __init__(self, directory, max_size_bytes):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pcm")
+
+    def _scan(self):
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                if not file_name.endswith(".pcm"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, file_name))
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, file_name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.size += size
+        # Several processes may have written into the cache (e.g. prerender.py)
+        self._evict()
+        print("[i] Audio cache:", len(self.entries), "entries,", round(self.size / 1024 / 1024, 1), "MB")
+
+    def get(self, key):
+        """
+        Returns the cached audio or None
+        :param key: the cache key
+        :return: raw audio bytes or None
+        """
+        with self.lock:
+            path = self._path(key)
+            if key not in self.entries:
+                # The entry may have been written by another process (e.g. prerender.py) after the scan
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    self.misses += 1
+                    return None
+                self.entries[key] = size
+                self.size += size
+                # The adopted entry is the most recent one, so it is kept
+                self._evict()
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                self.size -= self.entries.pop(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """
+        Stores audio in the cache and evicts the least recently used entries if the budget is exceeded
+        :param key: the cache key
+        :param data: raw audio bytes
+        """
+        path = self._path(key)
+        with self.lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + "." + str(os.getpid()) + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print("[!] Unable to write audio cache entry", e)
+                return
+            if key in self.entries:
+                self.size -= self.entries.pop(key)
+            self.entries[key] = len(data)
+            self.size += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_size_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / total if total else 0.0,
+                "entries": len(self.entries),
+                "sizeBytes": self.size,
+            }
@@ -0,0 +1,151 @@
+import queue
+import threading
+import time
+
+from player import create_player, player_key
+from tts import tts_post_process
+
+# How often the player checks for cancellation and finished utterances
+CANCEL_POLL_INTERVAL = 0.01
+
+
+def worker_config(config):
+    """
+    Extracts the part of the config the audio worker needs (the full config contains the NPC database)
+    :param config: the global config
+    :return: picklable config subset
+    """
+    return {
+        "outputDeviceIndex": config["outputDeviceIndex"],
+        "tts": config["tts"]
+    }
+
+
+def audio_worker_main(command_queue, event_queue, cancel_generation, cancel_time, volume):
+    """
+    Entry point of the long-lived playback/post-processing process.
+    Commands (dicts with a "type" key):
+    * begin: {utterance, generation, config, start, export_prefix, voice} - announces a new utterance
+    * audio: {utterance, generation, index, audio, sample_rate} - a synthesized sentence
+    * end: {utterance, generation} - no more sentences for the utterance
+    * stop: shuts the worker down
+    Anything with a generation older than cancel_generation is dropped (cooperative cancellation).
+    Sentences are written into one long-lived output stream per device (see player.AudioPlayer), so they play
+    back to back; an utterance is finished once the stream played its last sentence.
+    Events: first_audio, cancelled and finished per utterance; metric for stage timings of the worker.
+    :param command_queue: multiprocessing queue with commands
+    :param event_queue: multiprocessing queue for events back to the client
+    :param cancel_generation: shared multiprocessing.Value incremented on every cancellation
+    :param cancel_time: shared multiprocessing.Value with the time of the last cancellation request
+    :param volume: shared multiprocessing.Value with the volume (read by the player on every audio block)
+    """
+    utterances = {}
+    play_queue = queue.Queue()
+
+    def is_cancelled(item):
+        return item["generation"] != cancel_generation.value
+
+    def post_process():
+        while True:
+            command = command_queue.get()
+            if command["type"] == "stop":
+                play_queue.put(command)
+                break
+            if is_cancelled(command):
+                utterances.pop(command["utterance"], None)
+                continue
+            if command["type"] == "begin":
+                utterances[command["utterance"]] = command
+            elif command["type"] == "audio":
+                utterance = utterances.get(command["utterance"])
+                if utterance is None:
+                    continue
+                try:
+                    start = time.perf_counter()
+                    command["audio"] = tts_post_process(utterance["config"], command["audio"], command["sample_rate"],
+                                                        command["index"], utterance["export_prefix"],
+                                                        utterance.get("voice"))
+                    event_queue.put({"type": "metric", "name": "post_process", "value": time.perf_counter() - start})
+                except Exception as e:
+                    print("[!] Error during post-processing", e)
+                play_queue.put(command)
+            elif command["type"] == "end":
+                play_queue.put(command)
+
+    def play():
+        player = None
+        current_key = None
+        # Utterances with audio in the player: utterance -> {"command", "end" (stream position), "ended",
+        # "first_audio" (stream position of its first sentence until it was reached), "start" (time received)}
+        playing = {}
+        while True:
+            try:
+                command = play_queue.get(timeout=CANCEL_POLL_INTERVAL)
+            except queue.Empty:
+                command = None
+
+            cancelled = [utterance for utterance, entry in playing.items() if is_cancelled(entry["command"])]
+            if cancelled:
+                player.clear()
+                event_queue.put({"type": "cancelled", "utterance": cancelled[0],
+                                 "latency": time.time() - cancel_time.value})
+                for utterance in cancelled:
+                    playing.pop(utterance)
+            if playing:
+                played = player.played()
+                for utterance, entry in list(playing.items()):
+                    if entry["first_audio"] is not None and entry["first_audio"] < played:
+                        # Measured when playback reaches the utterance, not when it was queued behind others
+                        event_queue.put({"type": "first_audio", "utterance": utterance,
+                                         "latency": time.time() - entry["start"]})
+                        entry["first_audio"] = None
+                    if entry["ended"] and entry["end"] <= played:
+                        playing.pop(utterance)
+                        event_queue.put({"type": "finished", "utterance": utterance})
+
+            if command is None:
+                continue
+            if command["type"] == "stop":
+                if player is not None:
+                    player.close()
+                break
+            utterance = utterances.get(command["utterance"])
+            if utterance is None or is_cancelled(command):
+                continue
+            if command["type"] == "end":
+                utterances.pop(command["utterance"], None)
+                if command["utterance"] in playing:
+                    # Finished once the player reached the end of its last sentence
+                    playing[command["utterance"]]["ended"] = True
+                else:
+                    event_queue.put({"type": "finished", "utterance": command["utterance"]})
+                continue
+
+            config = utterance["config"]
+            if player_key(config) != current_key:
+                # The output changed: the new device gets its own long-lived stream
+                if player is not None:
+                    player.close()
+                    for playing_utterance, entry in playing.items():
+                        if entry["ended"]:
+                            event_queue.put({"type": "finished", "utterance": playing_utterance})
+                    playing.clear()
+                try:
+                    player = create_player(config, lambda: volume.value)
+                    current_key = player_key(config)
+                except Exception as e:
+                    print("[!] Unable to open the audio output", e)
+                    player = None
+                    current_key = None
+                    continue
+
+            start, end = player.write(command["audio"], command["sample_rate"], lambda: is_cancelled(command))
+            entry = playing.setdefault(command["utterance"], {"first_audio": start, "start": utterance["start"]})
+            entry.update({"command": command, "end": end, "ended": False})
+
+    post_process_thread = threading.Thread(target=post_process, daemon=True)
+    post_process_thread.start()
+    play_thread = threading.Thread(target=play, daemon=True)
+    play_thread.start()
+    post_process_thread.join()
+    play_thread.join()
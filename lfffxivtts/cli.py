@@ -1,5 +1,7 @@
-from tts import tts_simple, tts_init
+from tts import tts_simple, tts_init, PIPER_MODELS
 from config import read_config
+import metrics
+from prerender import prerender
 
 def main():
     config = read_config()
@@ -8,6 +10,15 @@ def main():
         message = input("TTS> ")
         if message == "stop" or message == "exit":
             exit(0)
+        elif message == "models":
+            PIPER_MODELS.report()
+        elif message == "metrics":
+            for name, histogram in sorted(metrics.snapshot()["histograms"].items()):
+                print("[i]", name, "count", histogram["count"], "p50", round(histogram["p50"], 3),
+                      "p95", round(histogram["p95"], 3))
+            print("[i]", metrics.summary())
+        elif message.startswith("prerender "):
+            prerender(config, message[len("prerender "):].strip())
         elif message.startswith("lang "):
             lang = message.split(" ")[1].strip()
             if lang in ["auto", "de", "en", "fr", "jp"]:
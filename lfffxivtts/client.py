@@ -1,119 +1,216 @@
 import asyncio
 import json
 import multiprocessing
-import tempfile
 import time
-import sounddevice as sd
-import queue
 import threading
-import soundfile as sf
+from concurrent.futures import ThreadPoolExecutor
 
 import websockets
 
+import metrics
 from voice import select_voice
-from tts import tts_init, run_piper, tts_post_process
+from tts import tts_init, run_piper
+from noise_profile import ensure_noise_profile
+from audio_worker import audio_worker_main, worker_config
+from scheduler import DialogueScheduler
 import traceback
 import uuid
 
-CURRENT_PROCESS = None
-CURRENT_PROCESS_TMP = None
+AUDIO_WORKER = None
+AUDIO_COMMANDS = None
+AUDIO_EVENTS = None
+CANCEL_GENERATION = None
+CANCEL_TIME = None
+VOLUME = None
+SCHEDULER = None
+# Synthesis runs here, so the event loop keeps serving the websocket (Cancel messages, pings)
+SYNTHESIS_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="synthesis")
 
 
-def tts_cancel():
-    print("[>] Cancellation requested")
-    global CURRENT_PROCESS
-    global CURRENT_PROCESS_TMP
-    try:
-        if CURRENT_PROCESS is not None:
-            CURRENT_PROCESS.terminate()
-            CURRENT_PROCESS = None
-    except:
-        pass
-    try:
-        if CURRENT_PROCESS_TMP is not None:
-            CURRENT_PROCESS_TMP.cleanup()
-            CURRENT_PROCESS_TMP = None
-    except:
-        pass
-
-
-def tts_post_process_say(config, temp_dir, wav_files):
-    def generate_audio(audio_queue):
-        for index, piper_wav_file in enumerate(wav_files):
-            print("[i] Postprocess", index, "-->", piper_wav_file)
-            output_wav = tts_post_process(config, piper_wav_file, temp_dir, index)
-            audio_queue.put(output_wav)
-        audio_queue.put(None)
-
-    def play_audio(audio_queue):
-        while True:
-            if not audio_queue.empty():
-                wav_file = audio_queue.get()
-
-                # Break condition
-                if wav_file is None:
-                    break
-
-                wav_data, sample_rate = sf.read(wav_file)
-                device_id = int(config["outputDeviceIndex"])
-                if device_id < 0:
-                    device_id = None
-                sd.play(wav_data * config["volume"], samplerate=sample_rate, blocking=True, device=device_id)
-            else:
-                time.sleep(0.1)  # Sleep briefly to avoid busy waiting
-
-    audio_queue = queue.Queue()
-    generate_thread = threading.Thread(target=generate_audio, args=(audio_queue,))
-    generate_thread.start()
-
-    audio_thread = threading.Thread(target=play_audio, args=(audio_queue,))
-    audio_thread.start()
-
-    # Wait for the processing thread to finish
-    generate_thread.join()
-    audio_thread.join()
-
-
-def tts_say(config, message):
-    if not config["enable"]:
-        print("[w] NO TTS WILL BE GENERATED (not enabled)")
-        return
-
-    if "Speaker" not in message or not message["Speaker"]:
-        print("[!] Rejected: ", json.dumps({"type": "run", "data": message}))
-        return
-
-    payload = message["Payload"]
-    speaker = message["Speaker"] or ""
-    npc_id = message["NpcId"] or 0
-    lang = "auto"
-    if config["language"] != "auto":
-        lang = config["language"]
-    elif "Language" in message:
-        lang = { "English": "en", "German": "de", "French": "fr", "Japanese": "jp" }.get(message["Language"], "en")
+def record_cancel_latency(stage, latency):
+    metrics.record("cancel_latency_" + stage, latency)
+    print("[i] Cancellation latency (" + stage + ") was", round(latency * 1000, 1), "ms")
 
-    voice = select_voice(config, npc_id, speaker, lang)
 
-    if voice is None:
-        print("[!] No voice found. Cancelling!")
+def handle_audio_events(event_queue):
+    while True:
+        event = event_queue.get()
+        if event["type"] == "first_audio":
+            print("[i] Time to first audio was", event["latency"], "seconds")
+            metrics.record("time_to_first_audio", event["latency"], utterance=event["utterance"])
+        elif event["type"] == "metric":
+            metrics.record(event["name"], event["value"])
+        elif event["type"] == "cancelled":
+            print("[i] Playback of", event["utterance"], "was stopped")
+            record_cancel_latency("playback", event["latency"])
+        elif event["type"] == "finished":
+            metrics.increment("lines_played", utterance=event["utterance"])
+            if SCHEDULER is not None:
+                SCHEDULER.finished(event["utterance"])
+
+
+def start_audio_worker():
+    """
+    Starts the long-lived playback/post-processing process (or restarts it if it died)
+    """
+    global AUDIO_WORKER, AUDIO_COMMANDS, AUDIO_EVENTS, CANCEL_GENERATION, CANCEL_TIME, VOLUME
+    if AUDIO_WORKER is not None and AUDIO_WORKER.is_alive():
         return
+    if AUDIO_WORKER is not None:
+        print("[!] Audio worker died. Restarting ...")
+    if CANCEL_GENERATION is None:
+        CANCEL_GENERATION = multiprocessing.Value("i", 0)
+        CANCEL_TIME = multiprocessing.Value("d", 0.0)
+        VOLUME = multiprocessing.Value("d", 1.0)
+        AUDIO_EVENTS = multiprocessing.Queue()
+        threading.Thread(target=handle_audio_events, args=(AUDIO_EVENTS,), daemon=True).start()
+    AUDIO_COMMANDS = multiprocessing.Queue()
+    AUDIO_WORKER = multiprocessing.Process(target=audio_worker_main,
+                                           args=(AUDIO_COMMANDS, AUDIO_EVENTS, CANCEL_GENERATION, CANCEL_TIME,
+                                                 VOLUME),
+                                           daemon=True)
+    AUDIO_WORKER.start()
+    print("[i] Audio worker started")
+
+
+def set_volume(volume):
+    """
+    Applies the volume to the playback right away (including the sentence that is playing)
+    :param volume: the volume (1.0: unchanged)
+    """
+    if VOLUME is not None:
+        VOLUME.value = volume
 
-    global CURRENT_PROCESS_TMP
-    CURRENT_PROCESS_TMP = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
-    temp_dir = CURRENT_PROCESS_TMP.name
 
-    # Do piper inference here (multiprocessing drags the performance down due to DLL + model load)
+def tts_cancel():
+    print("[>] Cancellation requested")
+    if CANCEL_GENERATION is not None:
+        CANCEL_TIME.value = time.time()
+        with CANCEL_GENERATION.get_lock():
+            CANCEL_GENERATION.value += 1
+
+
+def message_language(config, message):
+    """
+    :param config: the global config
+    :param message: a Say message of the plugin
+    :return: the configured language or the language of the message ("auto" if neither is set)
+    """
+    if config["language"] != "auto":
+        return config["language"]
+    if "Language" in message:
+        return { "English": "en", "German": "de", "French": "fr", "Japanese": "jp" }.get(message["Language"], "en")
+    return "auto"
+
+
+def say_rejection(config, message):
+    """
+    Checks a Say message before it is queued (tts_say drops the same messages)
+    :param config: the global config
+    :param message: a Say message of the plugin
+    :return: why the message cannot be synthesized, None if it can
+    """
+    if not config["enable"]:
+        return "TTS is not enabled"
+    if not message.get("Payload"):
+        return "Payload is missing"
+    if not message.get("Speaker"):
+        return "Speaker is missing"
+    if select_voice(config, message.get("NpcId") or 0, message["Speaker"], message_language(config, message)) is None:
+        return "No voice found"
+    return None
+
+
+def dispatch():
+    """
+    Takes the generation snapshot of a line the scheduler handed out and registers its utterance.
+    Runs on the event loop like the handling of Cancel messages, so a Cancel either came before (and dropped
+    the line from the queue) or changes the generation (and cancels the line).
+    :return: (generation, utterance id) for tts_say
+    """
+    if CANCEL_GENERATION is None:
+        start_audio_worker()
+    utterance = uuid.uuid4().hex[:8]
+    if SCHEDULER is not None:
+        SCHEDULER.started(utterance)
+    return CANCEL_GENERATION.value, utterance
+
+
+def tts_say(config, message, generation, utterance):
+    """
+    Synthesizes a Say message; the audio worker post-processes and plays the sentences
+    :param config: the global config
+    :param message: the Say message of the plugin
+    :param generation: the cancel generation at dispatch (the line is cancelled once it changes)
+    :param utterance: the utterance id registered at dispatch
+    """
     start = time.time()
-    piper_wavs = list(run_piper(config, payload, voice["model"], voice["language"],
-                                voice["speaker"], temp_dir, "piper"))
-    end = time.time()
-    print("[i] Full piper inference time was", end - start, "seconds")
+    begun = False
+    pending = []
 
-    # Schedule audioplayer
-    global CURRENT_PROCESS
-    CURRENT_PROCESS = multiprocessing.Process(target=tts_post_process_say, args=(config, temp_dir, piper_wavs),
-                                              daemon=True)
-    CURRENT_PROCESS.start()
+    # Do piper inference here; the audio worker post-processes and plays the sentences.
+    # Without streaming, playback starts once the whole payload is synthesized.
+    def is_cancelled():
+        return CANCEL_GENERATION.value != generation
+
+    try:
+        if "ReceivedAt" in message:
+            metrics.record("queue_wait", start - message["ReceivedAt"])
+        if not config["enable"]:
+            print("[w] NO TTS WILL BE GENERATED (not enabled)")
+            return
+
+        if "Speaker" not in message or not message["Speaker"]:
+            print("[!] Rejected: ", json.dumps({"type": "run", "data": message}))
+            return
+
+        payload = message["Payload"]
+        speaker = message["Speaker"] or ""
+        npc_id = message.get("NpcId") or 0
+        lang = message_language(config, message)
+
+        with metrics.timer("voice_selection"):
+            voice = select_voice(config, npc_id, speaker, lang)
+
+        if voice is None:
+            print("[!] No voice found. Cancelling!")
+            return
+
+        start_audio_worker()
+        if config["tts"]["enableNoiseReduce"]:
+            # The audio worker has no models; it reads the persisted profile
+            ensure_noise_profile(config, voice)
+        streaming = config["tts"].get("streaming", True)
+        AUDIO_COMMANDS.put({"type": "begin", "utterance": utterance, "generation": generation,
+                            "config": worker_config(config), "start": start, "export_prefix": utterance + "_",
+                            "voice": voice})
+        begun = True
+
+        for index, (audio, sample_rate) in enumerate(run_piper(config, payload, voice["model"], voice["language"],
+                                                               voice["speaker"], utterance + "_", is_cancelled)):
+            if is_cancelled():
+                break
+            if index == 0:
+                metrics.record("first_sentence", time.time() - start, utterance=utterance)
+            pending.append({"type": "audio", "utterance": utterance, "generation": generation, "index": index,
+                            "audio": audio, "sample_rate": sample_rate})
+            if streaming:
+                AUDIO_COMMANDS.put(pending.pop())
+        if is_cancelled():
+            print("[i] Synthesis of", utterance, "cancelled")
+            record_cancel_latency("synthesis", time.time() - CANCEL_TIME.value)
+            return
+        metrics.record("synthesis", time.time() - start, utterance=utterance)
+    finally:
+        if begun:
+            # Also sent when cancelled or when synthesis failed, so the worker forgets the utterance
+            # (and reports it finished to the scheduler)
+            for command in pending:
+                AUDIO_COMMANDS.put(command)
+            AUDIO_COMMANDS.put({"type": "end", "utterance": utterance, "generation": generation})
+        elif SCHEDULER is not None:
+            # Never reached the audio worker, which would report it finished
+            SCHEDULER.finished(utterance)
 
 
 async def handle_message(config, message):
@@ -121,21 +218,28 @@ async def handle_message(config, message):
     try:
         data = json.loads(message)
         if data["Type"] == "Cancel":
-            tts_cancel()
+            metrics.increment("cancellations")
+            SCHEDULER.cancel_all()
         elif data["Type"] == "Say":
-            tts_cancel()
-            tts_say(config, data)
+            data["ReceivedAt"] = time.time()
+            metrics.increment("lines")
+            SCHEDULER.submit(data)
     except Exception as e:
         traceback.print_exc()
         print("[!] Unable to parse message!", e)
 
 
-async def start_ws(config):
+async def start_ws(config, websocket_uri=None):
+    """
+    Connects to the plugin and handles its messages, reconnecting if the connection is lost
+    :param config: the global config
+    :param websocket_uri: the plugin's websocket (default: websocketURI of the config)
+    """
     while True:
         try:
-            websocket_uri = config["websocketURI"]
-            print("[i] Attempting to connect to " + websocket_uri)
-            async with websockets.connect(websocket_uri) as websocket:
+            uri = websocket_uri or config["websocketURI"]
+            print("[i] Attempting to connect to " + uri)
+            async with websockets.connect(uri) as websocket:
                 print("[i] Connected to WebSocket server. Awaiting messages ...")
                 while True:
                     try:
@@ -151,26 +255,34 @@ async def start_ws(config):
         await asyncio.sleep(5)  # Retry after 5 seconds
 
 
-# async def start_tts(config):
-#     while True:
-#         if len(MESSAGE_QUEUE) > 0:
-#             message = MESSAGE_QUEUE.
-#         print("[i] uuu", config["volume"])
-#         await asyncio.sleep(1)
+async def start_tts(config):
+    while True:
+        message = await SCHEDULER.next()
+        generation, utterance = dispatch()
+        try:
+            await asyncio.get_running_loop().run_in_executor(SYNTHESIS_EXECUTOR, tts_say, config, message,
+                                                             generation, utterance)
+        except Exception as e:
+            traceback.print_exc()
+            print("[!] Unable to synthesize message!", e)
 
 
 async def start_client_(config):
+    global SCHEDULER
+    SCHEDULER = DialogueScheduler(config, tts_cancel)
     websocket_task = asyncio.create_task(start_ws(config))
-    # tts_task = asyncio.create_task(start_tts(config))
+    tts_task = asyncio.create_task(start_tts(config))
 
     print("[i] Starting websocket client & voice servers")
-    await websocket_task
+    await asyncio.gather(websocket_task, tts_task)
 
 
 def start_client(config):
-    # Initialize TTS
-    time.sleep(1)
+    # Initialize TTS (models are preloaded in the background, messages wait for their model)
+    metrics.configure(config)
     tts_init(config)
+    start_audio_worker()
+    set_volume(config["volume"])
     print("[i] TTS init complete")
 
     asyncio.run(start_client_(config))
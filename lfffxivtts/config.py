@@ -1,6 +1,12 @@
 import json
+import os
 import re
 
+from npcdb import NpcDatabase, convert_npcs
+from voice import build_voice_index
+
+NPCS_JSON_FILE = "lfffxivtts/resources/npcs.json"
+
 
 def read_genders(config):
     print("[i] Loading name-gender database ...")
@@ -31,8 +37,14 @@ def read_voices(config):
 
 
 def read_npcs(config):
-    with open("lfffxivtts/resources/npcs.json", "r") as f:
-        config["npcs"] = json.load(f)
+    npcs_file = "lfffxivtts/resources/npcs.bin"
+    if not os.path.exists(npcs_file) or os.path.getmtime(npcs_file) < os.path.getmtime(NPCS_JSON_FILE):
+        # The shipped database is missing or older than npcs.json -> convert into the (writable) cache
+        npcs_file = "cache/npcs.bin"
+        if not os.path.exists(npcs_file) or os.path.getmtime(npcs_file) < os.path.getmtime(NPCS_JSON_FILE):
+            print("[i] Converting NPC database ...")
+            convert_npcs(NPCS_JSON_FILE, npcs_file)
+    config["npcs"] = NpcDatabase(npcs_file)
     print("[i] --> Loaded", len(config["npcs"]), "NPCs")
 
 
@@ -45,10 +57,28 @@ def read_characters(config):
 def read_config():
     with open("config.json", "r") as f:
         config = json.load(f)
+    dialogue = config.setdefault("dialogue", {})
+    dialogue.setdefault("mode", "interrupt")
+    dialogue.setdefault("queueSize", 5)
+    dialogue.setdefault("lookahead", 1)
+    metrics = config.setdefault("metrics", {})
+    metrics.setdefault("enable", True)
+    metrics.setdefault("file", "cache/metrics.jsonl")
+    metrics.setdefault("maxSizeMB", 5)
+    metrics.setdefault("backupCount", 3)
+    metrics.setdefault("prometheusPort", 0)
+    server = config.setdefault("server", {})
+    server.setdefault("host", "localhost")
+    server.setdefault("httpPort", 8090)
+    server.setdefault("websocketPort", 8091)
+    server.setdefault("workers", 2)
+    server.setdefault("maxQueue", 32)
+    server.setdefault("upstreamURIs", [config["websocketURI"]])
     read_voices(config)
     read_npcs(config)
     read_characters(config)
     read_genders(config)
+    build_voice_index(config)
     print("[i] Configuration loaded")
 
     return config
@@ -61,6 +91,9 @@ def write_config(config):
         "enable": config["enable"],
         "outputDeviceIndex": config["outputDeviceIndex"],
         "websocketURI": config["websocketURI"],
+        "dialogue": config["dialogue"],
+        "metrics": config["metrics"],
+        "server": config["server"],
         "tts": config["tts"]
     }
     with open("config.json", "w") as f:
@@ -0,0 +1,159 @@
+from functools import lru_cache
+
+import numpy as np
+
+INT16_SCALE = 32768.0
+
+
+@lru_cache(maxsize=32)
+def _fade_curve(length):
+    # Same curve as pydub's fade: linear in amplitude (pydub steps it per millisecond)
+    curve = np.linspace(1.0, 0.0, length, dtype=np.float32)
+    curve.flags.writeable = False
+    return curve
+
+
+def int16_to_float32(data, out=None):
+    """
+    Converts 16-bit samples into float32 samples in [-1, 1]
+    :param data: raw 16-bit audio (bytes) or int16 array
+    :param out: optional float32 buffer with at least as many samples (the result is a view into it)
+    :return: float32 samples
+    """
+    samples = np.frombuffer(data, dtype=np.int16) if isinstance(data, (bytes, bytearray, memoryview)) else data
+    if out is None:
+        out = np.empty(len(samples), dtype=np.float32)
+    out = out[:len(samples)]
+    np.multiply(samples, np.float32(1.0 / INT16_SCALE), out=out, casting="unsafe")
+    return out
+
+
+def float32_to_int16(audio, out=None):
+    """
+    Converts float32 samples into 16-bit samples (clipping)
+    :param audio: float32 samples
+    :param out: optional int16 buffer with at least as many samples (the result is a view into it)
+    :return: int16 samples
+    """
+    if out is None:
+        out = np.empty(len(audio), dtype=np.int16)
+    out = out[:len(audio)]
+    scaled = np.multiply(audio, np.float32(INT16_SCALE), dtype=np.float32)
+    np.clip(scaled, -INT16_SCALE, INT16_SCALE - 1, out=scaled)
+    np.copyto(out, scaled, casting="unsafe")
+    return out
+
+
+def fade_in(audio, sample_rate, duration):
+    """
+    Fades in (in place)
+    :param audio: float32 samples
+    :param sample_rate: the sample rate
+    :param duration: fade duration in seconds
+    :return: the audio
+    """
+    length = min(len(audio), int(duration * sample_rate))
+    if length > 0:
+        audio[:length] *= _fade_curve(length)[::-1]
+    return audio
+
+
+def fade_out(audio, sample_rate, duration):
+    """
+    Fades out (in place)
+    :param audio: float32 samples
+    :param sample_rate: the sample rate
+    :param duration: fade duration in seconds
+    :return: the audio
+    """
+    length = min(len(audio), int(duration * sample_rate))
+    if length > 0:
+        audio[len(audio) - length:] *= _fade_curve(length)
+    return audio
+
+
+def apply_gain(audio, gain):
+    """
+    Multiplies by a linear gain (in place)
+    :param audio: float32 samples
+    :param gain: the gain
+    :return: the audio
+    """
+    if gain != 1.0:
+        audio *= np.float32(gain)
+    return audio
+
+
+def pad_silence(audio, sample_rate, before=0.0, after=0.0):
+    """
+    Surrounds the audio with silence (one allocation)
+    :param audio: float32 samples
+    :param sample_rate: the sample rate
+    :param before: leading silence in seconds
+    :param after: trailing silence in seconds
+    :return: float32 samples
+    """
+    start = int(before * sample_rate)
+    out = np.zeros(start + len(audio) + int(after * sample_rate), dtype=np.float32)
+    out[start:start + len(audio)] = audio
+    return out
+
+
+def assemble_sentence(wav_bytes, sample_rate, fade_duration=0.1, silence_duration=0.15):
+    """
+    Turns synthesized 16-bit audio into the float32 sentence that is played: fade out and trailing silence.
+    The output buffer is allocated once and the conversion writes directly into it.
+    :param wav_bytes: raw 16-bit audio
+    :param sample_rate: the sample rate
+    :param fade_duration: fade out duration in seconds
+    :param silence_duration: trailing silence in seconds
+    :return: float32 samples
+    """
+    samples = np.frombuffer(wav_bytes, dtype=np.int16)
+    out = np.empty(len(samples) + int(silence_duration * sample_rate), dtype=np.float32)
+    int16_to_float32(samples, out)
+    out[len(samples):] = 0.0
+    fade_out(out[:len(samples)], sample_rate, fade_duration)
+    return out
+
+
+def crossfade_concat(chunks, sample_rate, duration):
+    """
+    Concatenates audio chunks, overlapping consecutive chunks by a linear crossfade (one allocation)
+    :param chunks: list of float32 sample arrays
+    :param sample_rate: the sample rate
+    :param duration: crossfade duration in seconds
+    :return: float32 samples
+    """
+    chunks = [chunk for chunk in chunks if len(chunk)]
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    overlap = int(duration * sample_rate)
+    overlaps = [min(overlap, len(previous), len(chunk)) for previous, chunk in zip(chunks, chunks[1:])]
+    out = np.empty(sum(len(chunk) for chunk in chunks) - sum(overlaps), dtype=np.float32)
+    out[:len(chunks[0])] = chunks[0]
+    position = len(chunks[0])
+    for chunk, length in zip(chunks[1:], overlaps):
+        start = position - length
+        if length > 0:
+            ramp = np.linspace(0.0, 1.0, length, dtype=np.float32)
+            out[start:position] *= 1.0 - ramp
+            out[start:position] += chunk[:length] * ramp
+        out[position:start + len(chunk)] = chunk[length:]
+        position = start + len(chunk)
+    return out
+
+
+def resample(audio, source_rate, target_rate):
+    """
+    Resamples by linear interpolation (sufficient for speech at the usual 16-48 kHz rates)
+    :param audio: float32 samples
+    :param source_rate: the sample rate of the audio
+    :param target_rate: the wanted sample rate
+    :return: float32 samples
+    """
+    if source_rate == target_rate or len(audio) == 0:
+        return audio
+    length = int(round(len(audio) * target_rate / source_rate))
+    positions = np.arange(length, dtype=np.float64) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
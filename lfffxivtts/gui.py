@@ -3,11 +3,15 @@ import threading
 import wx
 import sys
 from config import read_config, write_config
-from client import start_client
+from client import start_client, set_volume
+from tts import PIPER_MODELS
+import metrics
 import sounddevice as sd
 
 LANGUAGE_CHOICES = ["auto", "en", "de", "fr", "jp"]
 LANGUAGE_CHOICES_LABELS = ["Auto-select language", "English", "German", "French", "Japanese"]
+DIALOGUE_MODE_CHOICES = ["interrupt", "queue", "latest"]
+DIALOGUE_MODE_CHOICES_LABELS = ["New line interrupts", "Queue lines", "Finish line, then latest"]
 
 
 class RedirectText:
@@ -63,16 +67,22 @@ class MainFrame(wx.Frame):
         for i, text in enumerate(LANGUAGE_CHOICES_LABELS):
             self.select_language.SetString(i, text)
 
+        self.select_dialogue_mode = wx.Choice(checkbox_panel, choices=DIALOGUE_MODE_CHOICES)
+        for i, text in enumerate(DIALOGUE_MODE_CHOICES_LABELS):
+            self.select_dialogue_mode.SetString(i, text)
+
         # self.checkbox_enable_voicefixer = wx.CheckBox(checkbox_panel, label="voicefixer (CPU intensive)")
         self.checkbox_enable_noisereduce = wx.CheckBox(checkbox_panel, label="noisereduce")
         self.checkbox_enable_tts = wx.CheckBox(checkbox_panel, label="Enable TTS")
 
         self.select_language.SetSelection(LANGUAGE_CHOICES.index(self.config["language"]))
+        self.select_dialogue_mode.SetSelection(DIALOGUE_MODE_CHOICES.index(self.config["dialogue"]["mode"]))
         # self.checkbox_enable_voicefixer.SetValue(self.config["tts"]["enableVoiceFixer"])
         self.checkbox_enable_noisereduce.SetValue(self.config["tts"]["enableNoiseReduce"])
         self.checkbox_enable_tts.SetValue(self.config["enable"])
 
         checkbox_panel_sizer.Add(self.select_language, flag=wx.ALL | wx.ALIGN_CENTER_VERTICAL, border=5)
+        checkbox_panel_sizer.Add(self.select_dialogue_mode, flag=wx.ALL | wx.ALIGN_CENTER_VERTICAL, border=5)
         checkbox_panel_sizer.Add(self.checkbox_enable_tts, flag=wx.ALL | wx.ALIGN_CENTER_VERTICAL, border=5)
         # checkbox_panel_sizer.Add(self.checkbox_enable_voicefixer, flag=wx.ALL | wx.ALIGN_CENTER_VERTICAL, border=5)
         checkbox_panel_sizer.Add(self.checkbox_enable_noisereduce, flag=wx.ALL | wx.ALIGN_CENTER_VERTICAL, border=5)
@@ -103,13 +113,19 @@ class MainFrame(wx.Frame):
 
         panel.SetSizer(panel_sizer)
 
+        self.status_bar = self.CreateStatusBar(2)
+        self.status_bar.SetStatusWidths([-1, -2])
+        self.status_timer = wx.Timer(self)
+
         # Event binding
         self.Bind(wx.EVT_CLOSE, self.on_close)
         self.Bind(wx.EVT_SHOW, self.on_show)
+        self.Bind(wx.EVT_TIMER, self.on_status_timer, self.status_timer)
         sys.stdout = RedirectText(self.log_text)
 
         self.volume_slider.Bind(wx.EVT_SLIDER, self.on_change_volume)
         self.select_language.Bind(wx.EVT_CHOICE, self.on_select_language)
+        self.select_dialogue_mode.Bind(wx.EVT_CHOICE, self.on_select_dialogue_mode)
         self.device_choice.Bind(wx.EVT_CHOICE, self.on_select_device)
         # self.checkbox_enable_voicefixer.Bind(wx.EVT_CHECKBOX, self.on_toggle_voicefixer)
         self.checkbox_enable_noisereduce.Bind(wx.EVT_CHECKBOX, self.on_toggle_noisereduce)
@@ -129,10 +145,17 @@ class MainFrame(wx.Frame):
         self.config["language"] = new_lang
         write_config(self.config)
 
+    def on_select_dialogue_mode(self, event):
+        new_mode = DIALOGUE_MODE_CHOICES[self.select_dialogue_mode.GetSelection()]
+        print("[>] dialogue mode =", new_mode)
+        self.config["dialogue"]["mode"] = new_mode
+        write_config(self.config)
+
     def on_change_volume(self, event):
         new_volume = self.volume_slider.GetValue() / 100
-        print("[>] volume =", new_volume, "(WILL BE APPLIED ON THE NEXT TTS)")
+        print("[>] volume =", new_volume)
         self.config["volume"] = new_volume
+        set_volume(new_volume)
         write_config(self.config)
 
     def on_confirm_websocket_uri(self, event):
@@ -162,10 +185,22 @@ class MainFrame(wx.Frame):
         self.config["enable"] = self.checkbox_enable_tts.GetValue()
         write_config(self.config)
 
+    def on_status_timer(self, event):
+        progress = PIPER_MODELS.progress()
+        if progress["ready"]:
+            self.status_bar.SetStatusText("TTS models ready (" + str(len(PIPER_MODELS.resident())) + " loaded)")
+        else:
+            self.status_bar.SetStatusText("Loading TTS models ... " + str(progress["loaded"]) + "/" +
+                                          str(progress["total"]))
+        # Recent p50/p95 of the main stages
+        self.status_bar.SetStatusText(metrics.summary(), 1)
+
     def on_show(self, event):
         print("[i] Starting lfFFXIVTTS ...")
+        self.status_timer.Start(500)
         self.voice_server = threading.Thread(target=start_client, args=(self.config,), daemon=True)
         self.voice_server.start()
 
     def on_close(self, event):
+        self.status_timer.Stop()
         self.Destroy()
@@ -0,0 +1,131 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from models import model_variant
+
+CALIBRATION_FILE = "cache/loudness.json"
+
+REFERENCE_TEXTS = {
+    "en": "Well met, adventurer. The road to Ul'dah is long and dangerous, so take care. "
+          "I have heard rumors of bandits near the crossroads. Will you lend us your aid?",
+    "de": "Seid gegrüßt, Abenteurer. Der Weg nach Ul'dah ist lang und gefährlich, also gebt Acht. "
+          "Ich habe Gerüchte über Banditen an der Kreuzung gehört. Werdet Ihr uns helfen?",
+    "fr": "Bien le bonjour, aventurier. La route vers Ul'dah est longue et dangereuse, alors soyez prudent. "
+          "On parle de bandits près du carrefour. Nous prêterez-vous main-forte ?",
+    "jp": "Well met, adventurer. The road to Ul'dah is long and dangerous, so take care.",
+}
+
+CALIBRATION = None
+
+
+def voice_key(config, voice):
+    """
+    :param config: the global config
+    :param voice: dict with model, language and speaker
+    :return: calibration key of the voice, including the model variant in use (a quantized model sounds different)
+    """
+    variant = model_variant(config["tts"].get("modelConfig", {}), voice["model"], voice["language"])
+    return voice["model"] + "_" + voice["language"] + ("." + variant if variant else "") + "/" + str(voice["speaker"])
+
+
+def read_calibration(config):
+    """
+    Returns the measured loudness per voice (loaded once)
+    :param config: the global config
+    :return: dict voice key -> integrated loudness (LUFS)
+    """
+    global CALIBRATION
+    if CALIBRATION is None:
+        calibration_file = config["tts"].get("loudnessCalibrationFile", CALIBRATION_FILE)
+        CALIBRATION = {}
+        if os.path.exists(calibration_file):
+            with open(calibration_file, "r") as f:
+                CALIBRATION = json.load(f)
+    return CALIBRATION
+
+
+def get_loudness_gain(config, voice):
+    """
+    Returns the linear gain that brings the voice to tts.loudnessNormalizationTarget
+    :param config: the global config
+    :param voice: dict with model, language and speaker
+    :return: gain or None if the voice was not calibrated
+    """
+    if voice is None:
+        return None
+    loudness = read_calibration(config).get(voice_key(config, voice))
+    if loudness is None:
+        return None
+    return float(10.0 ** ((config["tts"]["loudnessNormalizationTarget"] - loudness) / 20.0))
+
+
+def apply_limiter(audio, sample_rate, threshold=0.9, window=0.005):
+    """
+    Cheap peak limiter: computes the peak per window, derives a gain that keeps the peaks below the
+    threshold (taking the minimum of neighboring windows so the gain ramps in before a peak) and interpolates it.
+    Audio below the threshold is returned unchanged.
+    :param audio: float32 samples
+    :param sample_rate: the sample rate
+    :param threshold: maximum absolute amplitude
+    :param window: window length in seconds
+    :return: float32 samples
+    """
+    if len(audio) == 0 or np.max(np.abs(audio)) <= threshold:
+        return audio
+    block = max(1, int(window * sample_rate))
+    n_blocks = (len(audio) + block - 1) // block
+    peaks = np.pad(np.abs(audio), (0, n_blocks * block - len(audio))).reshape(n_blocks, block).max(axis=1)
+    gains = np.minimum(1.0, threshold / np.maximum(peaks, 1e-9))
+    gains = np.minimum(gains, np.minimum(np.append(gains[1:], 1.0), np.insert(gains[:-1], 0, 1.0)))
+    centers = np.arange(n_blocks) * block + block / 2
+    return (audio * np.interp(np.arange(len(audio)), centers, gains)).astype(np.float32)
+
+
+def calibrate_voices(config, force=False):
+    """
+    Synthesizes a reference text with every voice in voices.json and characters.json and stores its
+    integrated loudness, so the runtime only has to apply a gain
+    :param config: the global config
+    :param force: re-measure voices that were already calibrated
+    """
+    import pyloudnorm as pyln
+    from tts import run_piper
+
+    calibration_file = config["tts"].get("loudnessCalibrationFile", CALIBRATION_FILE)
+    calibration = dict(read_calibration(config))
+    voices = {}
+    for lang, lang_voices in config["voices"].items():
+        for voice in lang_voices:
+            voices[voice_key(config, voice)] = voice
+    for char in config["chars"].values():
+        for voice in char["tts"].values():
+            voices[voice_key(config, voice)] = voice
+
+    for index, (key, voice) in enumerate(sorted(voices.items())):
+        if key in calibration and not force:
+            continue
+        try:
+            text = REFERENCE_TEXTS.get(voice["language"], REFERENCE_TEXTS["en"])
+            sentences = list(run_piper(config, text, voice["model"], voice["language"], voice["speaker"]))
+            sample_rate = sentences[0][1]
+            audio = np.concatenate([sentence for sentence, _ in sentences])
+            calibration[key] = float(pyln.Meter(sample_rate).integrated_loudness(audio))
+            print("[i] Loudness calibration", index + 1, "/", len(voices), key, round(calibration[key], 1), "LUFS")
+        except Exception as e:
+            print("[!] Unable to calibrate", key, e)
+
+    os.makedirs(os.path.dirname(calibration_file) or ".", exist_ok=True)
+    with open(calibration_file, "w") as f:
+        json.dump(calibration, f, indent=4, sort_keys=True)
+    global CALIBRATION
+    CALIBRATION = calibration
+    print("[i] Loudness calibration written to", calibration_file)
+
+
+if __name__ == "__main__":
+    from config import read_config
+
+    calibrate_voices(read_config(), force="--force" in sys.argv)
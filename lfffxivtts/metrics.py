@@ -0,0 +1,215 @@
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Histogram buckets (seconds) of the stage latencies
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Number of recent measurements per stage used for the percentiles
+WINDOW = 500
+# Stages shown in the GUI summary: (metric, label)
+SUMMARY_STAGES = [("time_to_first_audio", "TTFA"), ("inference", "inference"), ("post_process", "post")]
+
+LISTENERS = []
+LISTENERS_LOCK = threading.Lock()
+METRICS_LOCK = threading.Lock()
+HISTOGRAMS = {}  # name -> {"buckets", "sum", "count", "recent"}
+COUNTERS = {}  # name -> value
+EXPORT_LOG = None
+EXPORT_SERVER = None
+
+
+def add_listener(listener):
+    """
+    Registers a function listener(name, value, labels) that is called for every recorded measurement
+    :param listener: the function
+    """
+    with LISTENERS_LOCK:
+        LISTENERS.append(listener)
+
+
+def remove_listener(listener):
+    with LISTENERS_LOCK:
+        if listener in LISTENERS:
+            LISTENERS.remove(listener)
+
+
+def _notify(name, value, labels):
+    with LISTENERS_LOCK:
+        listeners = list(LISTENERS)
+    for listener in listeners:
+        try:
+            listener(name, value, labels)
+        except Exception as e:
+            print("[!] Metrics listener failed", e)
+
+
+def record(name, value, **labels):
+    """
+    Records a stage latency into the histogram of the stage
+    :param name: the stage (e.g. inference)
+    :param value: the duration in seconds
+    :param labels: additional information (e.g. the utterance); only exported with the measurement itself
+    """
+    with METRICS_LOCK:
+        histogram = HISTOGRAMS.get(name)
+        if histogram is None:
+            histogram = HISTOGRAMS[name] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0,
+                                            "recent": deque(maxlen=WINDOW)}
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+        histogram["recent"].append(value)
+    _notify(name, value, labels)
+
+
+def increment(name, amount=1, **labels):
+    """
+    Increments a counter
+    :param name: the counter (e.g. audio_cache_hits)
+    :param amount: the increment
+    :param labels: additional information; only exported with the measurement itself
+    """
+    with METRICS_LOCK:
+        COUNTERS[name] = COUNTERS.get(name, 0) + amount
+    _notify(name, amount, labels)
+
+
+def timer(name, **labels):
+    """
+    Measures a block: with metrics.timer("phonemize"): ...
+    """
+    return _Timer(name, labels)
+
+
+class _Timer:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+def snapshot():
+    """
+    :return: {"histograms": name -> {count, sum, p50, p95}, "counters": name -> value}
+    """
+    with METRICS_LOCK:
+        histograms = {name: (histogram["count"], histogram["sum"], list(histogram["recent"]))
+                      for name, histogram in HISTOGRAMS.items()}
+        counters = dict(COUNTERS)
+    result = {"histograms": {}, "counters": counters}
+    for name, (count, total, recent) in histograms.items():
+        p50, p95 = np.percentile(recent, [50, 95]) if recent else (0.0, 0.0)
+        result["histograms"][name] = {"count": count, "sum": total, "p50": float(p50), "p95": float(p95)}
+    return result
+
+
+def summary():
+    """
+    :return: compact one-line summary (recent p50/p95 of the main stages and the audio cache hit rate)
+    """
+    current = snapshot()
+    parts = []
+    for name, label in SUMMARY_STAGES:
+        histogram = current["histograms"].get(name)
+        if histogram is not None:
+            parts.append(label + " " + str(round(histogram["p50"], 2)) + "/" + str(round(histogram["p95"], 2)) + "s")
+    hits = current["counters"].get("audio_cache_hits", 0)
+    misses = current["counters"].get("audio_cache_misses", 0)
+    if hits + misses:
+        parts.append("cache " + str(round(100 * hits / (hits + misses))) + "%")
+    return " | ".join(parts)
+
+
+def prometheus_text():
+    """
+    :return: the metrics in the Prometheus text exposition format
+    """
+    with METRICS_LOCK:
+        histograms = {name: (list(histogram["buckets"]), histogram["sum"], histogram["count"])
+                      for name, histogram in HISTOGRAMS.items()}
+        counters = dict(COUNTERS)
+    lines = []
+    for name, (buckets, total, count) in sorted(histograms.items()):
+        metric = "lfffxivtts_" + name + "_seconds"
+        lines.append("# TYPE " + metric + " histogram")
+        for bound, bucket in zip(BUCKETS, buckets):
+            lines.append(metric + '_bucket{le="' + str(bound) + '"} ' + str(bucket))
+        lines.append(metric + '_bucket{le="+Inf"} ' + str(count))
+        lines.append(metric + "_sum " + repr(total))
+        lines.append(metric + "_count " + str(count))
+    for name, value in sorted(counters.items()):
+        metric = "lfffxivtts_" + name + "_total"
+        lines.append("# TYPE " + metric + " counter")
+        lines.append(metric + " " + repr(value))
+    return "\n".join(lines) + "\n"
+
+
+class _PrometheusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _export_measurement(name, value, labels):
+    EXPORT_LOG.info(json.dumps({"time": round(time.time(), 3), "name": name, "value": value, **labels}))
+
+
+def configure(config):
+    """
+    Starts the exporters according to the config "metrics" section:
+    * file: rotating JSON-lines file with every measurement (maxSizeMB, backupCount)
+    * prometheusPort: serves http://localhost:<port>/metrics (0 disables it)
+    :param config: the global config
+    """
+    global EXPORT_LOG, EXPORT_SERVER
+    metrics_config = config.get("metrics", {})
+    if not metrics_config.get("enable", True):
+        return
+
+    if EXPORT_LOG is None and metrics_config.get("file", ""):
+        path = metrics_config["file"]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=int(float(metrics_config.get("maxSizeMB", 5)) * 1024 * 1024),
+            backupCount=int(metrics_config.get("backupCount", 3)), encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        EXPORT_LOG = logging.getLogger("lfffxivtts.metrics")
+        EXPORT_LOG.propagate = False
+        EXPORT_LOG.setLevel(logging.INFO)
+        EXPORT_LOG.addHandler(handler)
+        add_listener(_export_measurement)
+        print("[i] Writing metrics to", path)
+
+    port = int(metrics_config.get("prometheusPort", 0))
+    if EXPORT_SERVER is None and port > 0:
+        try:
+            EXPORT_SERVER = ThreadingHTTPServer(("localhost", port), _PrometheusHandler)
+            threading.Thread(target=EXPORT_SERVER.serve_forever, daemon=True).start()
+            print("[i] Serving metrics on http://localhost:" + str(port) + "/metrics")
+        except OSError as e:
+            print("[!] Unable to serve metrics on port", port, e)
@@ -0,0 +1,484 @@
+import hashlib
+import json
+import os
+import platform
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+SESSION_TUNING_FILE = "cache/session_tuning.json"
+SESSION_SETTINGS = ["intraOpThreads", "interOpThreads", "executionMode", "graphOptimizationLevel", "enableMemArena"]
+WARM_UP_PHONEMES = "həlˈoː."
+OPTIMIZED_MODEL_DIRECTORY = "cache/optimized_models"
+# Guards the index of the optimized model cache (models are loaded concurrently)
+OPTIMIZED_INDEX_LOCK = threading.Lock()
+
+
+def model_files(model, language, variant=""):
+    """
+    Returns the paths of a piper model
+    :param model: the model name
+    :param language: the model language
+    :param variant: a quantized variant of the model (e.g. int8, see quantize.py); "" is the original model
+    :return: (onnx file, json config file)
+    """
+    base = os.path.abspath("piper/models/" + model + "_" + language)
+    return base + ("." + variant if variant else "") + ".onnx", base + ".json"
+
+
+def model_variant(model_config, model, language):
+    """
+    :param model_config: tts.modelConfig of the config
+    :param model: the model name
+    :param language: the model language
+    :return: the variant selected by tts.modelConfig.<model_lang>.variant if it exists, "" for the original model
+    """
+    variant = model_config.get(model + "_" + language, {}).get("variant", "")
+    if variant and not os.path.exists(model_files(model, language, variant)[0]):
+        return ""
+    return variant
+
+
+def machine_id():
+    return {"node": platform.node(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def read_session_tuning(path=SESSION_TUNING_FILE):
+    """
+    Reads the session settings recorded by tune.py. They are only valid for the machine they were measured on.
+    :param path: the tuning file
+    :return: dict model_lang -> session settings
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            tuning = json.load(f)
+    except Exception as e:
+        print("[!] Unable to read session tuning", path, e)
+        return {}
+    if tuning.get("machine") != machine_id():
+        print("[i] Ignoring session tuning of another machine. Run tune.py again.")
+        return {}
+    return tuning.get("models", {})
+
+
+def session_options(settings):
+    """
+    Creates the ONNX Runtime session options
+    :param settings: dict with the optional keys intraOpThreads, interOpThreads, executionMode
+    ("sequential"/"parallel"), graphOptimizationLevel ("disabled"/"basic"/"extended"/"all") and enableMemArena
+    :return: onnxruntime.SessionOptions
+    """
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = int(settings.get("intraOpThreads", 0))
+    options.inter_op_num_threads = int(settings.get("interOpThreads", 0))
+    options.execution_mode = {
+        "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+        "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL
+    }[settings.get("executionMode", "sequential")]
+    options.graph_optimization_level = {
+        "disabled": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    }[settings.get("graphOptimizationLevel", "all")]
+    options.enable_cpu_mem_arena = bool(settings.get("enableMemArena", True))
+    return options
+
+
+def _read_optimized_index(directory):
+    path = os.path.join(directory, "index.json")
+    if not os.path.exists(path):
+        return {"files": {}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print("[!] Unable to read optimized model index", path, e)
+        return {"files": {}}
+
+
+def _temporary_file(path):
+    # Per process, so concurrent processes (e.g. prerendering) never write the same temporary file
+    return path + "." + str(os.getpid()) + ".tmp"
+
+
+def _write_optimized_index(directory, index):
+    path = os.path.join(directory, "index.json")
+    with open(_temporary_file(path), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(_temporary_file(path), path)
+
+
+def _indexed_file(index, path, parse):
+    """
+    Returns the index entry of a file, (re-)creating it if the file changed (size or modification time)
+    :param index: the optimized model index
+    :param path: the file
+    :param parse: function path -> dict of derived values (e.g. the hash)
+    :return: (entry, True if the entry was created)
+    """
+    stat = os.stat(path)
+    entry = index["files"].get(path)
+    if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return entry, False
+    entry = index["files"][path] = dict(parse(path), size=stat.st_size, mtime=stat.st_mtime)
+    return entry, True
+
+
+def _hash_file(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(block)
+    return {"sha1": sha1.hexdigest()}
+
+
+def _parse_config(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return {"config": json.load(f)}
+
+
+def optimized_model(model_file, config_file, settings, directory):
+    """
+    Looks up the graph-optimized model in the cache. Entries are keyed by the hash of the model file
+    (only recomputed if its size or modification time changed), the ONNX Runtime version and the optimization level.
+    The parsed voice config is cached in the index, too.
+    :param model_file: the ONNX file
+    :param config_file: the json config file
+    :param settings: session settings (see session_options)
+    :param directory: the cache directory
+    :return: (optimized ONNX file, True if it exists, parsed voice config)
+    """
+    import onnxruntime
+    level = settings.get("graphOptimizationLevel", "all")
+    with OPTIMIZED_INDEX_LOCK:
+        os.makedirs(directory, exist_ok=True)
+        index = _read_optimized_index(directory)
+        model_entry, model_changed = _indexed_file(index, os.path.abspath(model_file), _hash_file)
+        config_entry, config_changed = _indexed_file(index, os.path.abspath(config_file), _parse_config)
+        if model_changed or config_changed:
+            _write_optimized_index(directory, index)
+
+    name = os.path.basename(model_file)[:-len(".onnx")]
+    optimized_file = os.path.join(directory, "-".join([name, model_entry["sha1"][:16], "ort" + onnxruntime.__version__,
+                                                       level]) + ".onnx")
+    return optimized_file, os.path.exists(optimized_file), config_entry["config"]
+
+
+def _replace_optimized_model(directory, optimized_file):
+    """
+    Moves a newly optimized model into place and removes the previous entry of the model (changed model file or
+    ONNX Runtime version)
+    """
+    os.replace(_temporary_file(optimized_file), optimized_file)
+    name, _, _, level = os.path.basename(optimized_file)[:-len(".onnx")].rsplit("-", 3)
+    with OPTIMIZED_INDEX_LOCK:
+        index = _read_optimized_index(directory)
+        optimized = index.setdefault("optimized", {})
+        previous = optimized.get(name + "-" + level)
+        if previous is not None and previous != os.path.basename(optimized_file):
+            if os.path.exists(os.path.join(directory, previous)):
+                os.remove(os.path.join(directory, previous))
+            print("[i] Removed outdated optimized model", previous)
+        optimized[name + "-" + level] = os.path.basename(optimized_file)
+        _write_optimized_index(directory, index)
+
+
+def _drop_optimized_model(directory, optimized_file):
+    """
+    Removes an optimized model that cannot be loaded (e.g. truncated) from the cache
+    """
+    name, _, _, level = os.path.basename(optimized_file)[:-len(".onnx")].rsplit("-", 3)
+    with OPTIMIZED_INDEX_LOCK:
+        try:
+            os.remove(optimized_file)
+        except OSError as e:
+            print("[!] Unable to remove optimized model", optimized_file, e)
+        index = _read_optimized_index(directory)
+        if index.get("optimized", {}).get(name + "-" + level) == os.path.basename(optimized_file):
+            del index["optimized"][name + "-" + level]
+            _write_optimized_index(directory, index)
+
+
+def load_piper_voice(model_file, config_file, settings=None, cache_directory=""):
+    """
+    Loads a piper voice (like PiperVoice.load, but with configurable session options).
+    With a cache directory, the graph-optimized model is serialized on the first load and loaded without
+    optimizing it again on later loads.
+    :param model_file: the ONNX file
+    :param config_file: the json config file
+    :param settings: session settings (see session_options)
+    :param cache_directory: directory of the optimized model cache ("" disables it)
+    :return: PiperVoice
+    """
+    import onnxruntime
+    from piper import PiperVoice
+    from piper.config import PiperConfig
+    settings = settings or {}
+    options = session_options(settings)
+    session = None
+    if cache_directory and settings.get("graphOptimizationLevel", "all") != "disabled":
+        optimized_file, cached, config_dict = optimized_model(model_file, config_file, settings, cache_directory)
+        if cached:
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+            try:
+                session = onnxruntime.InferenceSession(optimized_file, sess_options=options,
+                                                       providers=["CPUExecutionProvider"])
+            except Exception as e:
+                print("[!] Unable to load optimized model", optimized_file, e, "--> optimizing", model_file, "again")
+                _drop_optimized_model(cache_directory, optimized_file)
+                cached = False
+                options = session_options(settings)
+        if not cached:
+            options.optimized_model_filepath = _temporary_file(optimized_file)
+    else:
+        optimized_file, cached = None, False
+        with open(config_file, "r", encoding="utf-8") as f:
+            config_dict = json.load(f)
+    if session is None:
+        session = onnxruntime.InferenceSession(str(model_file), sess_options=options,
+                                               providers=["CPUExecutionProvider"])
+    if optimized_file is not None and not cached and os.path.exists(_temporary_file(optimized_file)):
+        _replace_optimized_model(cache_directory, optimized_file)
+    return PiperVoice(config=PiperConfig.from_dict(config_dict), session=session)
+
+
+def warm_up(voice):
+    """
+    Runs a short inference, so the first line does not pay for the lazy initialization of the session
+    :param voice: PiperVoice
+    """
+    for _ in voice.synthesize_stream_raw(WARM_UP_PHONEMES, phoneme_input=True, sentence_silence=0.0):
+        pass
+
+
+def model_inputs(voice, phonemes, speaker_id):
+    """
+    :param voice: PiperVoice
+    :param phonemes: list of phonemes of a sentence
+    :param speaker_id: the speaker (ignored by single speaker models)
+    :return: the ONNX inputs of a piper model for a phonemized sentence (like PiperVoice.synthesize_ids_to_raw)
+    """
+    phoneme_ids = np.expand_dims(np.array(voice.phonemes_to_ids(phonemes), dtype=np.int64), 0)
+    inputs = {
+        "input": phoneme_ids,
+        "input_lengths": np.array([phoneme_ids.shape[1]], dtype=np.int64),
+        "scales": np.array([voice.config.noise_scale, voice.config.length_scale, voice.config.noise_w],
+                           dtype=np.float32)
+    }
+    if voice.config.num_speakers > 1:
+        inputs["sid"] = np.array([speaker_id], dtype=np.int64)
+    return inputs
+
+
+class ModelManager:
+    """
+    Loads piper voices on first use and keeps them within a budget (number of models and estimated memory).
+    The least recently used model is evicted first. Memory is estimated by the size of the ONNX file,
+    which dominates the resident size of a loaded session.
+    Different models are loaded concurrently; callers asking for a model that is still loading wait for it.
+    """
+
+    def __init__(self):
+        self.models = OrderedDict()  # model_lang -> {"voice", "memory", "load_time"}, least recently used first
+        self.loading = {}  # model_lang -> threading.Event set once loading finished
+        self.lock = threading.Lock()
+        self.max_models = 0
+        self.max_memory = 0
+        self.warm_up = True
+        self.optimized_model_directory = ""
+        self.model_config = {}
+        self.session_tuning = {}
+        self.preload_total = 0
+        self.preload_done = 0
+        self.preload_scheduled = False  # preload decided what to load (until then, nothing is ready)
+
+    def configure(self, config):
+        models_config = config["tts"].get("models", {})
+        self.max_models = int(models_config.get("maxModels", 0))
+        self.max_memory = int(models_config.get("maxMemoryMB", 0)) * 1024 * 1024
+        self.warm_up = bool(models_config.get("warmUp", True))
+        self.optimized_model_directory = models_config.get("optimizedModelDirectory", OPTIMIZED_MODEL_DIRECTORY)
+        self.model_config = config["tts"].get("modelConfig", {})
+        self.session_tuning = read_session_tuning(models_config.get("sessionTuningFile", SESSION_TUNING_FILE))
+
+    def session_settings(self, model_lang):
+        """
+        Session settings of a model: tuned settings of this machine (tune.py), overridden by tts.modelConfig
+        :param model_lang: model name and language (e.g. vctk_en)
+        :return: dict (see session_options)
+        """
+        settings = {key: value for key, value in self.session_tuning.get(model_lang, {}).items()
+                    if key in SESSION_SETTINGS}
+        model_config = self.model_config.get(model_lang, {})
+        settings.update({key: model_config[key] for key in SESSION_SETTINGS if key in model_config})
+        return settings
+
+    def files(self, model, language):
+        """
+        Returns the paths of a model, using the variant selected by tts.modelConfig.<model_lang>.variant
+        (the original model if the variant does not exist)
+        :param model: the model name
+        :param language: the model language
+        :return: (onnx file, json config file)
+        """
+        variant = self.model_config.get(model + "_" + language, {}).get("variant", "")
+        if model_variant(self.model_config, model, language) != variant:
+            print("[w] Model variant", os.path.basename(model_files(model, language, variant)[0]),
+                  "not found (run quantize.py). Using the original.")
+            return model_files(model, language)
+        return model_files(model, language, variant)
+
+    def get(self, model, language):
+        """
+        Returns the loaded voice, loading it if required
+        :param model: the model name
+        :param language: the model language
+        :return: PiperVoice
+        """
+        model_lang = model + "_" + language
+        while True:
+            with self.lock:
+                if model_lang in self.models:
+                    self.models.move_to_end(model_lang)
+                    return self.models[model_lang]["voice"]
+                loaded = self.loading.get(model_lang)
+                if loaded is None:
+                    loaded = self.loading[model_lang] = threading.Event()
+                    break
+            # Another thread is loading this model
+            loaded.wait()
+
+        try:
+            model_file, config_file = self.files(model, language)
+            print("[i] Loading TTS model", os.path.basename(model_file), "...")
+            start = time.time()
+            voice = load_piper_voice(model_file, config_file, self.session_settings(model_lang),
+                                     self.optimized_model_directory)
+            load_time = time.time() - start
+            print("[i] Loading TTS model", model_lang, "took", load_time, "seconds")
+            if self.warm_up:
+                start = time.time()
+                warm_up(voice)
+                print("[i] Warming up TTS model", model_lang, "took", time.time() - start, "seconds")
+            with self.lock:
+                self.models[model_lang] = {
+                    "voice": voice,
+                    "memory": os.path.getsize(model_file),
+                    "load_time": load_time
+                }
+                self._evict()
+            return voice
+        finally:
+            with self.lock:
+                del self.loading[model_lang]
+            loaded.set()
+
+    def _within_budget(self, models):
+        """
+        :param models: list of (model, language)
+        :return: the first models that fit into the budget together (at least one, like _evict)
+        """
+        selected = []
+        memory = 0
+        for model, language in models:
+            model_file = self.files(model, language)[0]
+            memory += os.path.getsize(model_file) if os.path.exists(model_file) else 0
+            if selected and ((self.max_models > 0 and len(selected) >= self.max_models) or
+                             (self.max_memory > 0 and memory > self.max_memory)):
+                break
+            selected.append((model, language))
+        return selected
+
+    def _evict(self):
+        while len(self.models) > 1 and (
+                (self.max_models > 0 and len(self.models) > self.max_models) or
+                (self.max_memory > 0 and self.memory() > self.max_memory)):
+            model_lang, _ = self.models.popitem(last=False)
+            print("[i] Evicted TTS model", model_lang, "(budget exceeded)")
+
+    def memory(self):
+        return sum(entry["memory"] for entry in self.models.values())
+
+    def preload(self, config, wait=False):
+        """
+        Loads the models according to tts.models.preload:
+        "all" (every model in voices.json), "active" (models of the configured language, or of every language
+        with voices if it is "auto") or "none". Only as many models as fit into the budget are preloaded.
+        The models are loaded concurrently (tts.models.preloadThreads) in the background.
+        :param config: the global config
+        :param wait: block until all models are loaded
+        """
+        models_config = config["tts"].get("models", {})
+        policy = models_config.get("preload", "active")
+        if policy == "none":
+            languages = []
+        elif policy == "active" and config["language"] != "auto":
+            languages = [config["language"]]
+        else:
+            # With "auto", every line may be in any language that has voices
+            languages = list(config["voices"])
+        to_load = []
+        for lang in languages:
+            for voice in config["voices"].get(lang, []):
+                if (voice["model"], voice["language"]) not in to_load:
+                    to_load.append((voice["model"], voice["language"]))
+        within_budget = self._within_budget(to_load)
+        if len(within_budget) < len(to_load):
+            print("[i] Preloading", len(within_budget), "of", len(to_load), "TTS models (budget of tts.models)")
+        to_load = within_budget
+        # Counted before any model loads, so progress() never reports ready too early
+        with self.lock:
+            self.preload_total += len(to_load)
+            self.preload_scheduled = True
+        if not to_load:
+            print("[i] No TTS models to preload --> models are loaded on first use")
+            return
+
+        def load(model, language):
+            try:
+                self.get(model, language)
+            except Exception as e:
+                print("[!] Unable to load TTS model", model + "_" + language, e)
+            with self.lock:
+                self.preload_done += 1
+                done = self.preload_done == self.preload_total
+            if done:
+                print("[i] TTS models ready")
+                self.report()
+
+        threads = int(models_config.get("preloadThreads", 0)) or min(len(to_load), os.cpu_count() or 1)
+        executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="model-preload")
+        futures = [executor.submit(load, model, language) for model, language in to_load]
+        executor.shutdown(wait=False)
+        if wait:
+            for future in futures:
+                future.result()
+
+    def progress(self):
+        """
+        :return: preloading progress {"loaded", "total", "ready"} (not ready before preload was called)
+        """
+        with self.lock:
+            return {"loaded": self.preload_done, "total": self.preload_total,
+                    "ready": self.preload_scheduled and self.preload_done >= self.preload_total}
+
+    def resident(self):
+        """
+        :return: list of loaded models (least recently used first) with their estimated memory
+        """
+        with self.lock:
+            return [{"model": model_lang, "memoryMB": round(entry["memory"] / 1024 / 1024, 1),
+                     "loadTime": entry["load_time"]} for model_lang, entry in self.models.items()]
+
+    def report(self):
+        resident = self.resident()
+        print("[i] Resident TTS models:", len(resident), "(" + str(round(self.memory() / 1024 / 1024, 1)) + " MB)")
+        for entry in resident:
+            print("[i] -->", entry["model"], entry["memoryMB"], "MB, loaded in", round(entry["loadTime"], 2), "seconds")
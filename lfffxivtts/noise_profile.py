@@ -0,0 +1,104 @@
+import os
+import threading
+
+import numpy as np
+
+from models import model_inputs, model_variant
+
+NOISE_PROFILE_DIRECTORY = "cache/noise_profiles"
+# Pause-only phoneme input: the model renders its noise floor without any speech
+NOISE_PROFILE_PHONEMES = ", , , , , , , , , , , ,"
+FRAME_LENGTH = 0.02
+# Share of the quietest frames kept as noise (the rest may contain breathing or vocoder artifacts)
+QUIET_FRAME_RATIO = 0.5
+# Longer clips do not improve the (stationary) noise estimate but cost an STFT on every sentence
+MAX_PROFILE_LENGTH = 0.5
+
+NOISE_PROFILES = {}
+NOISE_PROFILES_LOCK = threading.Lock()
+
+
+def profile_file(config, voice):
+    directory = config["tts"].get("noiseProfileDirectory", NOISE_PROFILE_DIRECTORY)
+    # The variant in use (e.g. int8) has its own noise floor
+    variant = model_variant(config["tts"].get("modelConfig", {}), voice["model"], voice["language"])
+    return os.path.join(directory, voice["model"] + "_" + voice["language"] + ("." + variant if variant else "") + "_"
+                        + str(voice["speaker"]) + ".npy")
+
+
+def quiet_frames(audio, sample_rate):
+    """
+    Keeps the quietest frames of the audio
+    :param audio: float32 samples
+    :param sample_rate: the sample rate
+    :return: float32 samples
+    """
+    frame = max(1, int(FRAME_LENGTH * sample_rate))
+    n_frames = len(audio) // frame
+    if n_frames < 2:
+        return audio
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    energy = np.mean(frames ** 2, axis=1)
+    keep = np.sort(np.argsort(energy)[:max(1, int(n_frames * QUIET_FRAME_RATIO))])
+    return frames[keep].reshape(-1)
+
+
+def get_noise_profile(config, voice):
+    """
+    Returns the persisted noise clip of the voice (loaded once)
+    :param config: the global config
+    :param voice: dict with model, language and speaker
+    :return: float32 samples or None if there is no profile
+    """
+    if voice is None:
+        return None
+    path = profile_file(config, voice)
+    with NOISE_PROFILES_LOCK:
+        if path in NOISE_PROFILES:
+            return NOISE_PROFILES[path]
+    if not os.path.exists(path):
+        return None
+    try:
+        profile = np.load(path).astype(np.float32)
+    except Exception as e:
+        print("[!] Unable to read noise profile", path, e)
+        return None
+    with NOISE_PROFILES_LOCK:
+        NOISE_PROFILES[path] = profile
+    return profile
+
+
+def ensure_noise_profile(config, voice):
+    """
+    Builds the noise profile of the voice if it does not exist, yet: the model synthesizes pauses only and
+    the quietest frames are persisted in tts.noiseProfileDirectory. Requires the model, so this runs
+    where the synthesis happens (post-processing only reads the profile).
+    :param config: the global config
+    :param voice: dict with model, language and speaker
+    :return: float32 samples or None if the profile could not be built
+    """
+    profile = get_noise_profile(config, voice)
+    if profile is not None:
+        return profile
+
+    from tts import PIPER_MODELS
+    path = profile_file(config, voice)
+    try:
+        piper_voice = PIPER_MODELS.get(voice["model"], voice["language"])
+        # The raw model output: piper peak-normalizes every clip, which would boost the pause-only clip far
+        # above the noise level of real sentences
+        audio = piper_voice.session.run(None, model_inputs(piper_voice, list(NOISE_PROFILE_PHONEMES),
+                                                           int(voice["speaker"])))[0].squeeze().astype(np.float32)
+        profile = quiet_frames(audio, piper_voice.config.sample_rate)[:int(MAX_PROFILE_LENGTH *
+                                                                            piper_voice.config.sample_rate)]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path + ".tmp.npy", profile)
+        os.replace(path + ".tmp.npy", path)
+        print("[i] Built noise profile", path, "-->", round(len(profile) / piper_voice.config.sample_rate, 2),
+              "seconds")
+    except Exception as e:
+        print("[!] Unable to build noise profile", path, e)
+        return None
+    with NOISE_PROFILES_LOCK:
+        NOISE_PROFILES[path] = profile
+    return profile
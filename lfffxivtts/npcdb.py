@@ -0,0 +1,172 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+
+from voice import normalize_name
+
+# File layout (little endian, all sections 4-byte aligned):
+#   header      magic, count, codes size, names size
+#   codes       JSON {"race": [...], "gender": [...], "clan": [...]} (interned attribute values)
+#   ids         int32[count], sorted ascending
+#   name_ends   uint32[count], end offset of each name in the name table
+#   by_name     uint32[count], row indices sorted by (normalized name, id)
+#   race        uint8[count]
+#   gender      uint8[count]
+#   clan        uint8[count]
+#   names       utf-8 name table
+MAGIC = b"LFNPCDB1"
+HEADER = struct.Struct("<8sIII")
+ATTRIBUTES = ["race", "gender", "clan"]
+
+
+def _align(size):
+    return (size + 3) // 4 * 4
+
+
+def _name_key(name):
+    return normalize_name(name).strip()
+
+
+def convert_npcs(json_file, output_file):
+    """
+    Converts the npcs.json dict-of-dicts into the binary NPC database
+    :param json_file: the npcs.json file
+    :param output_file: the output file
+    """
+    with open(json_file, "r", encoding="utf-8") as f:
+        npcs = json.load(f)
+
+    rows = sorted(npcs.values(), key=lambda npc: int(npc["npc_id"]))
+    codes = {attribute: [] for attribute in ATTRIBUTES}
+    code_maps = {attribute: {} for attribute in ATTRIBUTES}
+    columns = {attribute: bytearray() for attribute in ATTRIBUTES}
+    names = bytearray()
+    name_ends = []
+    for npc in rows:
+        for attribute in ATTRIBUTES:
+            value = npc[attribute]
+            if value not in code_maps[attribute]:
+                code_maps[attribute][value] = len(codes[attribute])
+                codes[attribute].append(value)
+            columns[attribute].append(code_maps[attribute][value])
+        names += (npc["name"] or "").encode("utf-8")
+        name_ends.append(len(names))
+    by_name = sorted(range(len(rows)), key=lambda i: (_name_key(rows[i]["name"] or ""), int(rows[i]["npc_id"])))
+
+    codes_bytes = json.dumps(codes).encode("utf-8")
+    count = len(rows)
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    # Per process: the client and prerender processes may convert at the same time
+    tmp_file = output_file + "." + str(os.getpid()) + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, len(codes_bytes), len(names)))
+        f.write(codes_bytes.ljust(_align(len(codes_bytes)), b" "))
+        f.write(struct.pack("<%di" % count, *[int(npc["npc_id"]) for npc in rows]))
+        f.write(struct.pack("<%dI" % count, *name_ends))
+        f.write(struct.pack("<%dI" % count, *by_name))
+        for attribute in ATTRIBUTES:
+            f.write(bytes(columns[attribute]).ljust(_align(count), b"\0"))
+        f.write(bytes(names))
+    os.replace(tmp_file, output_file)
+    print("[i] Converted", count, "NPCs into", output_file)
+
+
+class NpcDatabase:
+    """
+    Read-only, memory-mapped NPC database. Behaves like the former dict of NPC id -> NPC dict
+    (npc_id in db, db[npc_id], db.get, len, items) and supports lookups by name.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mmap)
+        magic, count, codes_size, names_size = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("Not an NPC database: " + path)
+        offset = HEADER.size
+        self.count = count
+        self.codes = json.loads(bytes(view[offset:offset + codes_size]))
+        offset += _align(codes_size)
+        self.ids = view[offset:offset + 4 * count].cast("i")
+        offset += 4 * count
+        self.name_ends = view[offset:offset + 4 * count].cast("I")
+        offset += 4 * count
+        self.by_name = view[offset:offset + 4 * count].cast("I")
+        offset += 4 * count
+        self.columns = {}
+        for attribute in ATTRIBUTES:
+            self.columns[attribute] = view[offset:offset + count]
+            offset += _align(count)
+        self.names = view[offset:offset + names_size]
+
+    def __reduce__(self):
+        return NpcDatabase, (self.path,)
+
+    def __len__(self):
+        return self.count
+
+    def _row(self, npc_id):
+        try:
+            npc_id = int(npc_id)
+        except (TypeError, ValueError):
+            return -1
+        row = bisect.bisect_left(self.ids, npc_id)
+        if row < self.count and self.ids[row] == npc_id:
+            return row
+        return -1
+
+    def _name(self, row):
+        start = self.name_ends[row - 1] if row > 0 else 0
+        return bytes(self.names[start:self.name_ends[row]]).decode("utf-8")
+
+    def _npc(self, row):
+        npc = {"npc_id": self.ids[row], "name": self._name(row)}
+        for attribute in ATTRIBUTES:
+            npc[attribute] = self.codes[attribute][self.columns[attribute][row]]
+        return npc
+
+    def __contains__(self, npc_id):
+        return self._row(npc_id) >= 0
+
+    def __getitem__(self, npc_id):
+        row = self._row(npc_id)
+        if row < 0:
+            raise KeyError(npc_id)
+        return self._npc(row)
+
+    def get(self, npc_id, default=None):
+        row = self._row(npc_id)
+        return self._npc(row) if row >= 0 else default
+
+    def keys(self):
+        return (str(npc_id) for npc_id in self.ids)
+
+    def items(self):
+        return ((str(self.ids[row]), self._npc(row)) for row in range(self.count))
+
+    def find_by_name(self, normalized_name):
+        """
+        Finds an NPC by name (lowest id wins if several NPCs share the name)
+        :param normalized_name: name as returned by voice.normalize_name
+        :return: npc id (str) or None
+        """
+        normalized_name = normalized_name.strip()
+        if not normalized_name:
+            return None
+        position = bisect.bisect_left(self.by_name, normalized_name,
+                                      key=lambda row: _name_key(self._name(row)))
+        if position < self.count:
+            row = self.by_name[position]
+            if _name_key(self._name(row)) == normalized_name:
+                return str(self.ids[row])
+        return None
+
+
+if __name__ == "__main__":
+    convert_npcs(sys.argv[1] if len(sys.argv) > 1 else "lfffxivtts/resources/npcs.json",
+                 sys.argv[2] if len(sys.argv) > 2 else "lfffxivtts/resources/npcs.bin")
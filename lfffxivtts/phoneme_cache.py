@@ -0,0 +1,155 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import metrics
+
+# Minimum time between two writes of the persisted cache
+SAVE_INTERVAL = 30
+SENTENCE_END = ".!?…"
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class PhonemeCache:
+    """
+    LRU cache of espeak phonemizations, keyed by espeak voice and normalized sentence.
+    Known names (e.g. the player's name) are phonemized separately from the text around them,
+    so lines that only differ by the name share their cache entries.
+    Optionally persisted as JSON (written at most every SAVE_INTERVAL seconds and on exit).
+    """
+
+    def __init__(self, max_entries, path="", names=None):
+        """
+        :param max_entries: maximum number of cached fragments
+        :param path: JSON file to persist the cache in ("" keeps it in memory)
+        :param names: names that are phonemized on their own
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.entries = OrderedDict()  # (espeak voice, text) -> (phonemes, phonemization time), least recent first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+        self.dirty = False
+        self.last_save = time.time()
+        self.name_pattern = None
+        names = sorted(set(normalize_text(name) for name in names or [] if name.strip()), key=len, reverse=True)
+        if names:
+            # A name keeps the punctuation that follows it (espeak drops punctuation-only fragments)
+            self.name_pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in names) + r")\b([^\w\s]*)")
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for espeak_voice, text, phonemes, cost in data["entries"][-self.max_entries:]:
+                self.entries[(espeak_voice, text)] = (phonemes, cost)
+            print("[i] Phoneme cache:", len(self.entries), "entries loaded")
+        except Exception as e:
+            print("[!] Unable to read phoneme cache", self.path, e)
+
+    def save(self):
+        with self.lock:
+            if not self.path or not self.dirty:
+                return
+            data = {"entries": [[espeak_voice, text, phonemes, cost]
+                                for (espeak_voice, text), (phonemes, cost) in self.entries.items()]}
+            self.dirty = False
+            self.last_save = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Per process and thread: the client, prerender processes and benchmarks may save at the same time
+            tmp_path = self.path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print("[!] Unable to write phoneme cache", self.path, e)
+
+    def split_names(self, text):
+        """
+        :param text: normalized text
+        :return: fragments of the text, every known name (with the punctuation after it) is a fragment of its own
+        """
+        if self.name_pattern is None:
+            return [text]
+        fragments = []
+        position = 0
+        for match in self.name_pattern.finditer(text):
+            fragments.append(text[position:match.start()])
+            fragments.append(match.group(0))
+            position = match.end()
+        fragments.append(text[position:])
+        return [fragment.strip() for fragment in fragments if fragment.strip()]
+
+    def _phonemize(self, voice, text):
+        key = (voice.config.espeak_voice, text)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                self.time_saved += entry[1]
+            else:
+                self.misses += 1
+        if entry is not None:
+            metrics.increment("phoneme_cache_hits")
+            metrics.increment("phonemize_seconds_saved", entry[1])
+            return entry[0]
+        metrics.increment("phoneme_cache_misses")
+        start = time.perf_counter()
+        phonemes = voice.phonemize(text)
+        cost = time.perf_counter() - start
+        with self.lock:
+            self.entries[key] = (phonemes, cost)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+            save = self.path and time.time() - self.last_save > SAVE_INTERVAL
+        if save:
+            self.save()
+        return phonemes
+
+    def phonemize(self, voice, text):
+        """
+        Phonemizes like voice.phonemize, but serves known fragments from the cache
+        :param voice: the piper voice
+        :param text: the text (a sentence-sized chunk)
+        :return: list of phoneme lists (one per sentence)
+        """
+        sentences = [[]]
+        for fragment in self.split_names(normalize_text(text)):
+            for i, phonemes in enumerate(self._phonemize(voice, fragment)):
+                if i == 0:
+                    # The fragment continues the current sentence
+                    if sentences[-1] and sentences[-1][-1] != " ":
+                        sentences[-1].append(" ")
+                    sentences[-1].extend(phonemes)
+                else:
+                    sentences.append(list(phonemes))
+            if fragment[-1] in SENTENCE_END:
+                sentences.append([])
+        return [sentence for sentence in sentences if sentence]
+
+    def stats(self):
+        """
+        :return: hits, misses, hit rate, entries and the phonemization time saved by hits (seconds)
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hitRate": self.hits / total if total else 0.0,
+                    "entries": len(self.entries), "timeSaved": self.time_saved}
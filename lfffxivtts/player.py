@@ -0,0 +1,199 @@
+import threading
+import time
+
+import numpy as np
+
+from dsp import resample
+
+BUFFER_SECONDS = 30
+WAIT_INTERVAL = 0.01
+# Samples below this level at the end of a queued sentence are silence (padding) that a crossfade replaces
+SILENCE_LEVEL = 1e-3
+
+
+class AudioPlayer:
+    """
+    Long-lived output stream of a device. Sentences are written into a ring buffer that the PortAudio callback
+    reads from, so consecutive sentences play without gaps and without reopening the stream.
+    Audio is resampled once to the native rate of the device; the volume is read on every callback (applies live).
+    Positions (write/played) are in seconds of the stream (samples at the device rate / device rate) and can be
+    used to wait for a sentence to be played.
+    """
+
+    def __init__(self, device=None, volume=None, crossfade=0.02):
+        """
+        :param device: sounddevice device index (None: default device)
+        :param volume: function returning the current volume
+        :param crossfade: crossfade between consecutive sentences in seconds (0: keep the pauses between them)
+        """
+        import sounddevice as sd
+        self.device = device
+        self.volume = volume or (lambda: 1.0)
+        self.sample_rate = int(sd.query_devices(device, "output")["default_samplerate"])
+        self.crossfade = int(crossfade * self.sample_rate)
+        self.buffer = np.zeros(BUFFER_SECONDS * self.sample_rate, dtype=np.float32)
+        self.read_position = 0  # samples read by the callback (absolute)
+        self.write_position = 0  # samples written (absolute)
+        self.condition = threading.Condition()
+        self.stream = sd.OutputStream(samplerate=self.sample_rate, channels=1, dtype="float32", device=device,
+                                      latency="low", callback=self._callback)
+        self.stream.start()
+
+    def _callback(self, outdata, frames, time_info, status):
+        out = outdata[:, 0]
+        with self.condition:
+            n = min(frames, self.write_position - self.read_position)
+            start = self.read_position % len(self.buffer)
+            first = min(n, len(self.buffer) - start)
+            out[:first] = self.buffer[start:start + first]
+            out[first:n] = self.buffer[:n - first]
+            self.read_position += n
+            self.condition.notify_all()
+        out[n:] = 0.0
+        volume = self.volume()
+        if volume != 1.0:
+            out *= volume
+
+    def _copy_in(self, position, audio):
+        start = position % len(self.buffer)
+        first = min(len(audio), len(self.buffer) - start)
+        self.buffer[start:start + first] = audio[:first]
+        self.buffer[:len(audio) - first] = audio[first:]
+
+    def write(self, audio, sample_rate, is_cancelled=None):
+        """
+        Queues a sentence for playback (blocks while the ring buffer is full).
+        If the previous sentence is still queued, its trailing silence is dropped and the two are crossfaded
+        over the end of its voiced audio, so consecutive sentences play without a gap.
+        :param audio: float32 samples
+        :param sample_rate: the sample rate of the audio
+        :param is_cancelled: optional function; writing stops once it returns True
+        :return: (start, end) stream positions (seconds) at which the sentence starts and has been played
+        """
+        audio = resample(audio, sample_rate, self.sample_rate)
+        with self.condition:
+            if self.crossfade > 0 and len(audio) > 0:
+                self._drop_trailing_silence()
+            overlap = min(self.crossfade, len(audio), max(0, self.write_position - self.read_position - self.crossfade))
+            start_position = self.write_position - overlap
+            if overlap > 0:
+                ramp = np.linspace(0.0, 1.0, overlap, dtype=np.float32)
+                start = start_position % len(self.buffer)
+                tail = np.concatenate([self.buffer[start:start + overlap],
+                                       self.buffer[:max(0, start + overlap - len(self.buffer))]])
+                self._copy_in(start_position, tail * (1.0 - ramp) + audio[:overlap] * ramp)
+            written = overlap
+            while written < len(audio):
+                free = len(self.buffer) - (self.write_position - self.read_position)
+                if free == 0:
+                    if is_cancelled is not None and is_cancelled():
+                        break
+                    self.condition.wait(WAIT_INTERVAL)
+                    continue
+                n = min(free, len(audio) - written)
+                self._copy_in(self.write_position, audio[written:written + n])
+                self.write_position += n
+                written += n
+            return start_position / self.sample_rate, self.write_position / self.sample_rate
+
+    def _drop_trailing_silence(self):
+        # Only audio that has not been read by the callback, yet
+        queued = self.write_position - self.read_position
+        if queued <= 0:
+            return
+        start = self.read_position % len(self.buffer)
+        samples = np.concatenate([self.buffer[start:start + queued],
+                                  self.buffer[:max(0, start + queued - len(self.buffer))]])
+        voiced = np.flatnonzero(np.abs(samples) > SILENCE_LEVEL)
+        self.write_position = self.read_position + (int(voiced[-1]) + 1 if len(voiced) else 0)
+
+    def played(self):
+        """
+        :return: stream position (seconds) that has been played
+        """
+        with self.condition:
+            return self.read_position / self.sample_rate
+
+    def wait(self, position, is_cancelled=None):
+        """
+        Waits until the stream position has been played
+        :param position: stream position (seconds) as returned by write
+        :param is_cancelled: optional function; waiting stops once it returns True
+        :return: True if the position was reached
+        """
+        with self.condition:
+            while self.read_position / self.sample_rate < position:
+                if is_cancelled is not None and is_cancelled():
+                    return False
+                self.condition.wait(WAIT_INTERVAL)
+            return True
+
+    def clear(self):
+        """
+        Drops everything that has not been played, yet (cancellation)
+        """
+        with self.condition:
+            self.write_position = self.read_position
+            self.condition.notify_all()
+
+    def close(self):
+        self.clear()
+        self.stream.stop()
+        self.stream.close()
+
+
+class NullPlayer:
+    """
+    Player without an audio device (benchmarks): "plays" in real time, optionally sped up
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.written = 0.0
+        self.busy_until = time.time()
+        self.lock = threading.Lock()
+
+    def write(self, audio, sample_rate, is_cancelled=None):
+        with self.lock:
+            duration = len(audio) / sample_rate
+            self.busy_until = max(time.time(), self.busy_until) + duration / self.speed
+            self.written += duration
+            return self.written - duration, self.written
+
+    def played(self):
+        with self.lock:
+            return self.written - max(0.0, self.busy_until - time.time()) * self.speed
+
+    def wait(self, position, is_cancelled=None):
+        while self.played() < position:
+            if is_cancelled is not None and is_cancelled():
+                return False
+            time.sleep(WAIT_INTERVAL)
+        return True
+
+    def clear(self):
+        with self.lock:
+            now = time.time()
+            self.written -= max(0.0, self.busy_until - now) * self.speed
+            self.busy_until = now
+
+    def close(self):
+        self.clear()
+
+
+def create_player(config, volume=None):
+    """
+    Creates the player for the configured output (tts.audioSink "device" or "null")
+    :param config: the (worker) config
+    :param volume: function returning the current volume
+    :return: AudioPlayer or NullPlayer
+    """
+    if config["tts"].get("audioSink", "device") == "null":
+        return NullPlayer(float(config["tts"].get("nullSinkSpeed", 1.0)))
+    device_id = int(config["outputDeviceIndex"])
+    return AudioPlayer(device_id if device_id >= 0 else None, volume,
+                       float(config["tts"].get("crossfadeSeconds", 0.02)))
+
+
+def player_key(config):
+    return config["tts"].get("audioSink", "device"), int(config["outputDeviceIndex"])
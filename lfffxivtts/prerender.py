@@ -0,0 +1,203 @@
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+LANGUAGES = {"English": "en", "German": "de", "French": "fr", "Japanese": "jp"}
+# Lines per task sent to a worker process
+CHUNK_SIZE = 8
+PROGRESS_INTERVAL = 5
+
+WORKER_CONFIG = None
+
+
+def read_corpus(path):
+    """
+    Reads the lines to pre-render from a JSON list or a CSV file with the columns npc_id, speaker, text, language
+    (the plugin field names NpcId, Speaker, Payload and Language work, too)
+    :param path: the corpus file
+    :return: list of {"id", "npc_id", "speaker", "text", "language"}
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f)) if path.lower().endswith(".csv") else json.load(f)
+    lines = []
+    for row in rows:
+        text = row.get("text", row.get("Payload", "")) or ""
+        if not text.strip():
+            continue
+        line = {
+            "npc_id": row.get("npc_id", row.get("NpcId", 0)) or 0,
+            "speaker": row.get("speaker", row.get("Speaker", "")) or "",
+            "text": text,
+            "language": row.get("language", row.get("Language", "")) or ""
+        }
+        line["language"] = LANGUAGES.get(line["language"], line["language"])
+        line["id"] = hashlib.sha1(json.dumps(line, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        lines.append(line)
+    return lines
+
+
+def read_progress(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def init_worker(intra_op_threads):
+    """
+    Initializes a worker process: every worker has its own config and loads its own models
+    :param intra_op_threads: ONNX Runtime threads per session (cores / workers)
+    """
+    global WORKER_CONFIG
+    from config import read_config
+    from tts import PIPER_MODELS, get_audio_cache, get_phoneme_cache
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = read_config()
+        for lang_voices in config["voices"].values():
+            for voice in lang_voices:
+                model_config = config["tts"]["modelConfig"].setdefault(voice["model"] + "_" + voice["language"], {})
+                model_config.setdefault("intraOpThreads", intra_op_threads)
+        # Persisting is left to the interactive client (the workers would overwrite each other's file)
+        config["tts"].setdefault("phonemeCache", {})["persist"] = False
+        PIPER_MODELS.configure(config)
+        get_audio_cache(config)
+        get_phoneme_cache(config)
+    WORKER_CONFIG = config
+
+
+def render(lines):
+    """
+    Synthesizes lines into the audio cache (runs in a worker process)
+    :param lines: list of lines with their resolved voice
+    :return: list of (line id, audio seconds, error or None)
+    """
+    from tts import run_piper
+    results = []
+    for line in lines:
+        voice = line["voice"]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                audio_seconds = sum(len(audio) / sample_rate for audio, sample_rate in
+                                    run_piper(WORKER_CONFIG, line["text"], voice["model"], voice["language"],
+                                              voice["speaker"]))
+            results.append((line["id"], audio_seconds, None))
+        except Exception as e:
+            results.append((line["id"], 0.0, str(e)))
+    return results
+
+
+def prerender(config, corpus_file, workers=0, restart=False):
+    """
+    Synthesizes all lines of a corpus into the audio cache, so they are played back without inference.
+    Finished lines are recorded in <corpus_file>.progress, an interrupted run continues where it stopped.
+    :param config: the global config
+    :param corpus_file: JSON or CSV corpus (see read_corpus)
+    :param workers: number of worker processes (0: one per core)
+    :param restart: ignore the progress of previous runs
+    :return: throughput report
+    """
+    from voice import select_voice
+
+    if not config["tts"].get("audioCache", {}).get("enable", True):
+        print("[!] The audio cache is disabled (tts.audioCache.enable). Nothing to pre-render into.")
+        return None
+
+    progress_file = corpus_file + ".progress"
+    if restart and os.path.exists(progress_file):
+        os.remove(progress_file)
+    done = read_progress(progress_file)
+    lines = [line for line in read_corpus(corpus_file) if line["id"] not in done]
+    print("[i] Pre-rendering", len(lines), "lines (" + str(len(done)) + " already done)")
+
+    default_language = config["language"] if config["language"] != "auto" else "en"
+    with contextlib.redirect_stdout(io.StringIO()):
+        for line in lines:
+            line["voice"] = select_voice(config, line["npc_id"], line["speaker"],
+                                         line["language"] or default_language)
+    skipped = [line for line in lines if line["voice"] is None]
+    # Lines of the same model end up in the same tasks, so workers load fewer models
+    lines = sorted([line for line in lines if line["voice"] is not None],
+                   key=lambda line: (line["voice"]["model"], line["voice"]["language"], str(line["voice"]["speaker"])))
+    if skipped:
+        print("[w]", len(skipped), "lines without a voice are skipped")
+    if not lines:
+        return None
+
+    workers = workers or os.cpu_count() or 1
+    intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+    report = {"lines": 0, "failed": 0, "skipped": len(skipped), "audioSeconds": 0.0}
+    start = time.time()
+    last_progress = start
+    with open(progress_file, "a", encoding="utf-8") as progress, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                initargs=(intra_op_threads,)) as executor:
+        futures = [executor.submit(render, lines[i:i + CHUNK_SIZE]) for i in range(0, len(lines), CHUNK_SIZE)]
+        try:
+            for future in as_completed(futures):
+                for line_id, audio_seconds, error in future.result():
+                    if error is not None:
+                        report["failed"] += 1
+                        print("[!] Unable to pre-render line", line_id, error)
+                        continue
+                    report["lines"] += 1
+                    report["audioSeconds"] += audio_seconds
+                    progress.write(line_id + "\n")
+                progress.flush()
+                now = time.time()
+                if now - last_progress > PROGRESS_INTERVAL:
+                    last_progress = now
+                    finished = report["lines"] + report["failed"]
+                    eta = (now - start) / finished * (len(lines) - finished) if finished else 0
+                    print("[i] Pre-rendered", finished, "/", len(lines), "lines,",
+                          round(report["audioSeconds"] / (now - start), 1), "audio seconds per second, ETA",
+                          round(eta / 60, 1), "min")
+        except KeyboardInterrupt:
+            print("[i] Interrupted. Run again to continue.")
+            for future in futures:
+                future.cancel()
+            raise
+
+    report["wallTime"] = time.time() - start
+    report["linesPerMinute"] = report["lines"] / report["wallTime"] * 60 if report["wallTime"] else 0.0
+    report["audioSecondsPerSecond"] = report["audioSeconds"] / report["wallTime"] if report["wallTime"] else 0.0
+    report["workers"] = workers
+    print("[i] Pre-rendering finished:", json.dumps(report))
+
+    from audio_cache import AudioCache
+    cache_config = config["tts"].get("audioCache", {})
+    max_size = int(cache_config.get("maxSizeMB", 512)) * 1024 * 1024
+    cache_stats = AudioCache(cache_config.get("directory", "cache/audio"), max_size).stats()
+    if cache_stats["sizeBytes"] >= max_size * 0.95:
+        print("[w] The audio cache is full, older entries were evicted. Increase tts.audioCache.maxSizeMB.")
+    return report
+
+
+def main():
+    """
+    Usage (from the repository root): python lfffxivtts/prerender.py <corpus.json|corpus.csv> [--workers N] [--restart]
+    """
+    from config import read_config
+
+    args = sys.argv[1:]
+    workers = 0
+    if "--workers" in args:
+        position = args.index("--workers")
+        workers = int(args[position + 1])
+        del args[position:position + 2]
+    restart = "--restart" in args
+    args = [arg for arg in args if arg != "--restart"]
+    if len(args) != 1:
+        print(main.__doc__)
+        return
+    prerender(read_config(), args[0], workers, restart)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from config import read_config
+from loudness import REFERENCE_TEXTS
+from models import load_piper_voice, model_files, model_inputs, warm_up
+
+# Quantization method -> model variant (<model>_<lang>.<variant>.onnx)
+VARIANTS = {"dynamic": "int8", "static": "int8-static"}
+REPORT_FILE = "cache/quantization.json"
+REPETITIONS = 3
+# Speakers per model the variants are compared on
+MAX_SPEAKERS = 3
+MFCC_COEFFICIENTS = 13
+
+
+def model_speakers(config, model, language):
+    """
+    :return: up to MAX_SPEAKERS speaker ids of the model that are used by voices.json
+    """
+    speakers = []
+    for lang_voices in config["voices"].values():
+        for voice in lang_voices:
+            if voice["model"] == model and voice["language"] == language and voice["speaker"] not in speakers:
+                speakers.append(voice["speaker"])
+    return speakers[:MAX_SPEAKERS] or [0]
+
+
+def quantize_model(model, language, method, speakers):
+    """
+    Writes the quantized variant of a model next to the original
+    * dynamic: int8 weights, activations are quantized at runtime (no calibration)
+    * static: int8 weights and activations (QDQ), calibrated on the reference sentences of the speakers
+    :param model: the model name
+    :param language: the model language
+    :param method: "dynamic" or "static"
+    :param speakers: speaker ids used for the calibration
+    :return: the quantized ONNX file
+    """
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, \
+        quantize_static
+
+    model_file, config_file = model_files(model, language)
+    quantized_file = model_files(model, language, VARIANTS[method])[0]
+    if method == "dynamic":
+        quantize_dynamic(model_file, quantized_file, weight_type=QuantType.QInt8)
+        return quantized_file
+
+    voice = load_piper_voice(model_file, config_file)
+    text = REFERENCE_TEXTS.get(language, REFERENCE_TEXTS["en"])
+    calibration = [model_inputs(voice, phonemes, speaker)
+                   for speaker in speakers for phonemes in voice.phonemize(text)]
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = iter(calibration)
+
+        def get_next(self):
+            return next(self.inputs, None)
+
+    quantize_static(model_file, quantized_file, Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return quantized_file
+
+
+def resident_memory():
+    import psutil
+    return psutil.Process().memory_info().rss
+
+
+def synthesize(voice, sentences, speakers):
+    """
+    Synthesizes every sentence for every speaker without noise (the outputs of two variants are comparable)
+    :return: (list of int16 arrays, median time of the whole set in seconds)
+    """
+    times = []
+    audios = []
+    for _ in range(REPETITIONS):
+        audios = []
+        start = time.perf_counter()
+        for speaker in speakers:
+            for phonemes in sentences:
+                audio = voice.synthesize_ids_to_raw(voice.phonemes_to_ids(phonemes), speaker_id=speaker,
+                                                    noise_scale=0.0, noise_w=0.0)
+                audios.append(np.frombuffer(audio, dtype=np.int16))
+        times.append(time.perf_counter() - start)
+    return audios, statistics.median(times)
+
+
+def mfcc_distance(reference, audio, sample_rate):
+    """
+    Mean euclidean distance of the MFCCs (without c0) along the DTW path, so small timing differences between
+    the variants do not count. 0 means identical.
+    """
+    import librosa
+    features = [librosa.feature.mfcc(y=samples.astype(np.float32) / 32768, sr=sample_rate,
+                                     n_mfcc=MFCC_COEFFICIENTS + 1)[1:] for samples in [reference, audio]]
+    cost, path = librosa.sequence.dtw(features[0], features[1], metric="euclidean")
+    return float(cost[-1, -1] / len(path))
+
+
+def evaluate(model, language, variant, speakers):
+    """
+    Compares a variant with the original model: model size, memory, inference time and MFCC distance
+    :return: report of the variant
+    """
+    text = REFERENCE_TEXTS.get(language, REFERENCE_TEXTS["en"])
+    results = {}
+    for name, current in [("original", ""), ("quantized", variant)]:
+        model_file, config_file = model_files(model, language, current)
+        memory = resident_memory()
+        voice = load_piper_voice(model_file, config_file)
+        warm_up(voice)
+        memory = resident_memory() - memory
+        sentences = voice.phonemize(text)
+        audios, duration = synthesize(voice, sentences, speakers)
+        results[name] = {"sizeMB": os.path.getsize(model_file) / 1024 / 1024, "memoryMB": memory / 1024 / 1024,
+                         "inferenceTime": duration, "audios": audios, "sampleRate": voice.config.sample_rate}
+        del voice
+
+    original, quantized = results["original"], results["quantized"]
+    distances = [mfcc_distance(reference, audio, original["sampleRate"])
+                 for reference, audio in zip(original["audios"], quantized["audios"])]
+    report = {"variant": variant, "speakers": speakers}
+    for key in ["sizeMB", "memoryMB", "inferenceTime"]:
+        report[key] = {"original": original[key], "quantized": quantized[key]}
+    report["speedup"] = original["inferenceTime"] / quantized["inferenceTime"]
+    report["mfccDistance"] = {"mean": float(np.mean(distances)), "max": float(np.max(distances))}
+    return report
+
+
+def main():
+    """
+    Writes int8 variants of the piper models (<model>_<lang>.int8.onnx with --method dynamic,
+    <model>_<lang>.int8-static.onnx with --method static) and compares them with the originals.
+    The report is stored in cache/quantization.json. Select a variant with tts.modelConfig.<model_lang>.variant.
+    Requires the onnx package (pip install onnx).
+    Usage (from the repository root): python lfffxivtts/quantize.py [--method dynamic|static] [--report-only]
+    [model_lang ...]
+    """
+    args = sys.argv[1:]
+    method = "dynamic"
+    if "--method" in args:
+        position = args.index("--method")
+        method = args[position + 1]
+        del args[position:position + 2]
+    if method not in VARIANTS:
+        print(main.__doc__)
+        return
+    report_only = "--report-only" in args
+    args = [arg for arg in args if arg != "--report-only"]
+
+    config = read_config()
+    model_langs = args or sorted(set(voice["model"] + "_" + voice["language"]
+                                     for lang_voices in config["voices"].values() for voice in lang_voices))
+
+    report = {}
+    if os.path.exists(REPORT_FILE):
+        with open(REPORT_FILE, "r") as f:
+            report = json.load(f)
+
+    for model_lang in model_langs:
+        model, language = model_lang.rsplit("_", 1)
+        speakers = model_speakers(config, model, language)
+        try:
+            if not report_only:
+                print("[i] Quantizing", model_lang, "(" + method + ") ...")
+                start = time.time()
+                quantized_file = quantize_model(model, language, method, speakers)
+                print("[i] Wrote", quantized_file, "in", round(time.time() - start, 1), "seconds")
+            result = evaluate(model, language, VARIANTS[method], speakers)
+            report.setdefault(model_lang, {})[VARIANTS[method]] = result
+            print("[i]", model_lang, VARIANTS[method] + ":", round(result["speedup"], 2), "x faster,",
+                  round(result["sizeMB"]["quantized"], 1), "MB instead of", round(result["sizeMB"]["original"], 1),
+                  "MB, MFCC distance", round(result["mfccDistance"]["mean"], 2))
+        except Exception as e:
+            print("[!] Unable to quantize", model_lang, e)
+
+    os.makedirs(os.path.dirname(REPORT_FILE) or ".", exist_ok=True)
+    with open(REPORT_FILE, "w") as f:
+        json.dump(report, f, indent=4)
+    print("[i] Report written to", REPORT_FILE)
+
+
+if __name__ == "__main__":
+    main()
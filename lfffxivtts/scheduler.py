@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from collections import deque
+
+
+class DialogueScheduler:
+    """
+    Decides which Say messages are synthesized and when (config dialogue.mode):
+    * interrupt: a new line cancels everything (playing and pending)
+    * queue: lines are played back to back, the oldest pending line is dropped if more than dialogue.queueSize wait
+    * latest: the playing line finishes, only the newest pending line is kept
+    The next line is synthesized while the current one is playing, but at most dialogue.lookahead lines
+    are synthesized ahead of playback.
+    """
+
+    def __init__(self, config, cancel):
+        """
+        :param config: the global config
+        :param cancel: function that cancels the synthesis and playback of all lines
+        """
+        self.config = config
+        self.cancel = cancel
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.outstanding = set()  # utterances sent to the audio worker that did not finish playing, yet
+        self.lock = threading.Lock()
+
+    def submit(self, message):
+        dialogue = self.config["dialogue"]
+        mode = dialogue["mode"]
+        if mode == "queue":
+            while len(self.pending) >= max(1, int(dialogue["queueSize"])):
+                dropped = self.pending.popleft()
+                print("[i] Dialogue queue full. Dropping line of", dropped["Speaker"])
+        elif mode == "latest":
+            if self.pending:
+                print("[i] Dropping", len(self.pending), "pending line(s) in favor of the latest")
+            self.pending.clear()
+        else:
+            self.cancel_all()
+        self.pending.append(message)
+        self.wakeup.set()
+
+    def cancel_all(self):
+        self.pending.clear()
+        with self.lock:
+            self.outstanding.clear()
+        self.cancel()
+
+    def started(self, utterance):
+        with self.lock:
+            self.outstanding.add(utterance)
+
+    def finished(self, utterance):
+        """
+        Called (from any thread) once an utterance finished playing
+        :param utterance: the utterance id
+        """
+        with self.lock:
+            self.outstanding.discard(utterance)
+
+    def ahead(self):
+        with self.lock:
+            return len(self.outstanding)
+
+    async def next(self):
+        """
+        Waits for the next line that may be synthesized
+        :return: the Say message
+        """
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            if self.ahead() > int(self.config["dialogue"]["lookahead"]):
+                # Enough audio is queued up, wait for playback to catch up
+                await asyncio.sleep(0.05)
+                continue
+            return self.pending.popleft()
@@ -0,0 +1,388 @@
+import asyncio
+import io
+import itertools
+import json
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import soundfile as sf
+import websockets
+
+import client
+import metrics
+from config import read_config
+from dsp import float32_to_int16
+from noise_profile import ensure_noise_profile
+from scheduler import DialogueScheduler
+from tts import run_piper, tts_init, tts_post_process
+from voice import select_voice
+
+# Lines of the plugins (played locally) go before synthesis requests of the API with the default priority
+PLAY_PRIORITY = 10
+
+
+class SynthesisPool:
+    """
+    Fixed number of synthesis threads fed by a bounded priority queue.
+    Higher priorities are served first, requests of the same priority in order of submission.
+    The models are shared by all threads (ONNX Runtime sessions can be run concurrently).
+    """
+
+    def __init__(self, workers, max_queue):
+        """
+        :param workers: number of synthesis threads
+        :param max_queue: maximum number of waiting requests (further requests are rejected)
+        """
+        self.queue = queue.PriorityQueue(max_queue)
+        self.sequence = itertools.count()
+        for index in range(workers):
+            threading.Thread(target=self._work, name="synthesis-" + str(index), daemon=True).start()
+
+    def submit(self, priority, function, *args, block=False):
+        """
+        :param priority: the priority of the request
+        :param function: called with args by a synthesis thread
+        :param block: wait for a free place in the queue instead of raising queue.Full
+        :return: concurrent.futures.Future of the result
+        """
+        future = Future()
+        self.queue.put((-priority, next(self.sequence), time.time(), future, function, args), block=block)
+        return future
+
+    def _work(self):
+        while True:
+            _, _, submitted, future, function, args = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            metrics.record("server_queue_wait", time.time() - submitted)
+            try:
+                future.set_result(function(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+
+def synthesize(config, message, chunks, is_cancelled):
+    """
+    Synthesizes a Say message and puts the post-processed sentences into chunks (runs in the synthesis pool)
+    :param config: the global config
+    :param message: {"Payload", "Speaker", "NpcId", "Language"} like the messages of the plugin
+    :param chunks: queue.Queue receiving (float32 samples, sample rate) per sentence and None at the end
+    :param is_cancelled: function; synthesis stops once it returns True (client disconnected)
+    """
+    try:
+        voice = select_voice(config, message.get("NpcId") or 0, message.get("Speaker") or "",
+                             client.message_language(config, message))
+        if voice is None:
+            raise ValueError("No voice found")
+        if config["tts"]["enableNoiseReduce"]:
+            ensure_noise_profile(config, voice)
+        for index, (audio, sample_rate) in enumerate(run_piper(config, message["Payload"], voice["model"],
+                                                               voice["language"], voice["speaker"], "",
+                                                               is_cancelled)):
+            if is_cancelled():
+                break
+            chunks.put((tts_post_process(config, audio, sample_rate, index, "", voice), sample_rate))
+    except Exception as e:
+        print("[!] Unable to synthesize request", e)
+    finally:
+        chunks.put(None)
+
+
+class LoopQueue:
+    """
+    Receives the sentences of a synthesis thread (like queue.Queue.put) for a coroutine of the event loop,
+    so open streams do not hold a thread while they wait
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+def read_chunks(chunks):
+    """
+    :return: generator of (float32 samples, sample rate) until the end of the synthesis
+    """
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return
+        yield chunk
+
+
+class SynthesisServer:
+    """
+    Headless server: loads the models once and shares them between
+    * the plugins (upstream websockets of server.upstreamURIs, their lines are played locally like in the GUI)
+    * the websocket API (ws://<host>:<websocketPort>): Say messages of the plugin format with "Output": "play"
+      (default) or "stream" (answered with {"Type": "Audio", "Id", "Index", "SampleRate"} and the int16 PCM
+      of every sentence as binary message, then {"Type": "Done", "Id"}) and Cancel messages (with the "Id" of a
+      streamed request: stops that request; without "Id": cancels the played lines like the plugin)
+    * the HTTP API (http://<host>:<httpPort>): POST /say with the same JSON; "Output": "stream" answers with a WAV
+      file ("Format": "wav", default) or chunked int16 PCM per sentence ("Format": "pcm", rate in X-Sample-Rate)
+    Synthesis runs in a bounded pool of threads; requests carry an optional "Priority" (default 0).
+    """
+
+    def __init__(self, config):
+        server_config = config["server"]
+        self.config = config
+        self.pool = SynthesisPool(int(server_config["workers"]), int(server_config["maxQueue"]))
+        self.loop = None
+
+    def stream(self, message, chunks=None):
+        """
+        Starts the synthesis of a message
+        :param message: the Say message
+        :param chunks: receives the sentences (default: a new queue.Queue)
+        :return: (queue of sentences, cancel event); raises queue.Full if the server is busy
+        """
+        chunks = chunks if chunks is not None else queue.Queue()
+        cancelled = threading.Event()
+        metrics.increment("server_requests")
+        try:
+            self.pool.submit(int(message.get("Priority", 0)), synthesize, self.config, message, chunks,
+                             cancelled.is_set)
+        except queue.Full:
+            metrics.increment("server_rejected")
+            raise
+        return chunks, cancelled
+
+    async def play(self, message):
+        await client.handle_message(self.config, json.dumps(dict(message, Type="Say")))
+
+    async def play_lines(self):
+        # Like client.start_tts, but the plugin lines share the synthesis pool with the API
+        while True:
+            message = await client.SCHEDULER.next()
+            generation, utterance = client.dispatch()
+            try:
+                future = await self.loop.run_in_executor(None, lambda: self.pool.submit(
+                    PLAY_PRIORITY, client.tts_say, self.config, message, generation, utterance, block=True))
+                await asyncio.wrap_future(future)
+            except Exception as e:
+                traceback.print_exc()
+                print("[!] Unable to synthesize message!", e)
+                client.SCHEDULER.finished(utterance)
+
+    async def handle_websocket(self, websocket):
+        # Streamed requests run as their own tasks, so Cancel messages are read while they stream
+        streams = {}  # Id -> cancel event of the streamed requests of this connection
+        tasks = set()
+        send_lock = asyncio.Lock()
+
+        async def run_stream(message, chunks, cancelled):
+            try:
+                await self.stream_websocket(websocket, send_lock, message, chunks, cancelled)
+            finally:
+                if streams.get(message.get("Id")) is cancelled:
+                    del streams[message["Id"]]
+
+        try:
+            async for raw in websocket:
+                try:
+                    message = json.loads(raw)
+                    if message.get("Type") == "Cancel" and message.get("Id") is not None:
+                        if message["Id"] in streams:
+                            streams[message["Id"]].set()
+                        else:
+                            await websocket.send(json.dumps({"Type": "Error", "Id": message["Id"],
+                                                             "Error": "No streamed request with this Id"}))
+                    elif message.get("Type") == "Cancel":
+                        await client.handle_message(self.config, raw)
+                    elif message.get("Type") == "Say" and message.get("Output", "play") == "play":
+                        rejection = client.say_rejection(self.config, message)
+                        if rejection is not None:
+                            await websocket.send(json.dumps({"Type": "Error", "Id": message.get("Id"),
+                                                             "Error": rejection}))
+                        else:
+                            await self.play(message)
+                    elif message.get("Type") == "Say":
+                        if message.get("Id") is not None and message["Id"] in streams:
+                            await websocket.send(json.dumps({"Type": "Error", "Id": message["Id"],
+                                                             "Error": "Id is already streaming"}))
+                            continue
+                        chunks, cancelled = self.stream(message, LoopQueue(self.loop))
+                        if message.get("Id") is not None:
+                            streams[message["Id"]] = cancelled
+                        task = asyncio.create_task(run_stream(message, chunks, cancelled))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    else:
+                        await websocket.send(json.dumps({"Type": "Error", "Id": message.get("Id"),
+                                                         "Error": "Unknown message type"}))
+                except websockets.ConnectionClosed:
+                    raise
+                except queue.Full:
+                    await websocket.send(json.dumps({"Type": "Error", "Id": message.get("Id"),
+                                                     "Error": "Server busy"}))
+                except Exception as e:
+                    print("[!] Unable to handle API message!", e)
+                    await websocket.send(json.dumps({"Type": "Error", "Error": str(e)}))
+        finally:
+            for cancelled in streams.values():
+                cancelled.set()
+
+    async def stream_websocket(self, websocket, send_lock, message, chunks, cancelled):
+        """
+        Sends the sentences of a streamed request until it is done or cancelled (Cancel with its Id)
+        :param send_lock: asyncio.Lock of the connection, keeps the Audio message and its PCM together
+        """
+        index = 0
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if cancelled.is_set():
+                    continue
+                audio, sample_rate = chunk
+                async with send_lock:
+                    await websocket.send(json.dumps({"Type": "Audio", "Id": message.get("Id"), "Index": index,
+                                                     "SampleRate": sample_rate}))
+                    await websocket.send(float32_to_int16(audio).tobytes())
+                index += 1
+            await websocket.send(json.dumps({"Type": "Done", "Id": message.get("Id")}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            cancelled.set()
+
+    def http_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if self.path != "/say":
+                    self.send_error(404)
+                    return
+                try:
+                    message = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    if not message.get("Payload"):
+                        raise ValueError("Payload is missing")
+                    if message.get("Output", "play") == "play":
+                        # Lines to play are only queued here, so reject what tts_say would drop
+                        rejection = client.say_rejection(server.config, message)
+                        if rejection is not None:
+                            raise ValueError(rejection)
+                except Exception as e:
+                    self.send_error(400, str(e))
+                    return
+                if message.get("Output", "play") == "play":
+                    asyncio.run_coroutine_threadsafe(server.play(message), server.loop).result()
+                    self.send_response(202)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                try:
+                    chunks, cancelled = server.stream(message)
+                except queue.Full:
+                    self.send_error(503, "Server busy")
+                    return
+                try:
+                    if message.get("Format", "wav") == "pcm":
+                        self.send_pcm(chunks)
+                    else:
+                        self.send_wav(chunks)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    cancelled.set()
+
+            def send_wav(self, chunks):
+                sentences = list(read_chunks(chunks))
+                if not sentences:
+                    self.send_error(500, "Synthesis failed")
+                    return
+                wav = io.BytesIO()
+                sf.write(wav, np.concatenate([audio for audio, _ in sentences]), sentences[0][1], format="WAV",
+                         subtype="PCM_16")
+                body = wav.getvalue()
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_pcm(self, chunks):
+                started = False
+                for audio, sample_rate in read_chunks(chunks):
+                    if not started:
+                        started = True
+                        self.send_response(200)
+                        self.send_header("Content-Type", "audio/L16; rate=" + str(sample_rate) + "; channels=1")
+                        self.send_header("X-Sample-Rate", str(sample_rate))
+                        self.send_header("Transfer-Encoding", "chunked")
+                        self.end_headers()
+                    data = float32_to_int16(audio).tobytes()
+                    self.wfile.write(("%x\r\n" % len(data)).encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+                if not started:
+                    self.send_error(500, "Synthesis failed")
+                    return
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    async def run(self):
+        server_config = self.config["server"]
+        self.loop = asyncio.get_running_loop()
+        client.SCHEDULER = DialogueScheduler(self.config, client.tts_cancel)
+        host = server_config["host"]
+
+        if int(server_config["httpPort"]) > 0:
+            http_server = ThreadingHTTPServer((host, int(server_config["httpPort"])), self.http_handler())
+            threading.Thread(target=http_server.serve_forever, daemon=True).start()
+            print("[i] HTTP API on http://" + host + ":" + str(http_server.server_address[1]) + "/say")
+
+        tasks = [asyncio.create_task(self.play_lines())]
+        for uri in server_config["upstreamURIs"]:
+            tasks.append(asyncio.create_task(client.start_ws(self.config, uri)))
+        if int(server_config["websocketPort"]) > 0:
+            async with websockets.serve(self.handle_websocket, host, int(server_config["websocketPort"])) as server:
+                print("[i] Websocket API on ws://" + host + ":" + str(server.sockets[0].getsockname()[1]))
+                await asyncio.gather(*tasks)
+        else:
+            await asyncio.gather(*tasks)
+
+
+def start_server(config):
+    metrics.configure(config)
+    tts_init(config)
+    client.start_audio_worker()
+    client.set_volume(config["volume"])
+    print("[i] TTS init complete")
+    asyncio.run(SynthesisServer(config).run())
+
+
+def main():
+    """
+    Usage (from the repository root): python lfffxivtts/server.py [upstream websocket URI ...]
+    Without URIs, the server connects to server.upstreamURIs of config.json.
+    """
+    config = read_config()
+    if sys.argv[1:]:
+        config["server"]["upstreamURIs"] = sys.argv[1:]
+    start_server(config)
+
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("spawn")
+    main()
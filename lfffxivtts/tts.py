@@ -1,118 +1,364 @@
-import io
-import json
 import math
 import os
-import queue
-import tempfile
-import threading
+import re
 import time
+import uuid
 from os.path import join
 import numpy as np
 
-import sounddevice as sd
 import soundfile as sf
-from pydub import AudioSegment
 
+import metrics
 from voice import select_voice
+from audio_cache import AudioCache, make_cache_key
+from phoneme_cache import PhonemeCache
+from dsp import assemble_sentence
+from models import ModelManager
+from loudness import apply_limiter, get_loudness_gain
+from noise_profile import ensure_noise_profile, get_noise_profile
+from player import create_player, player_key
+
+PIPER_MODELS = ModelManager()
+AUDIO_CACHE = None
+PHONEME_CACHE = None
+# Player of tts_simple (the websocket client plays in the audio worker)
+PLAYER = None
+PLAYER_KEY = None
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?…])\s+")
+SHORT_UTTERANCE_PADDING = " "
+SILENCE_THRESHOLD = 500  # int16 amplitude below which padded output is considered silent
+
+
+def get_audio_cache(config):
+    """
+    Returns the persistent sentence cache or None if it is disabled
+    :param config: the global config
+    :return: AudioCache or None
+    """
+    global AUDIO_CACHE
+    cache_config = config["tts"].get("audioCache", {})
+    if not cache_config.get("enable", True):
+        return None
+    if AUDIO_CACHE is None:
+        AUDIO_CACHE = AudioCache(cache_config.get("directory", "cache/audio"),
+                                 int(cache_config.get("maxSizeMB", 512)) * 1024 * 1024)
+    return AUDIO_CACHE
+
+
+def get_phoneme_cache(config):
+    """
+    Returns the phonemization cache or None if it is disabled
+    :param config: the global config
+    :return: PhonemeCache or None
+    """
+    global PHONEME_CACHE
+    cache_config = config["tts"].get("phonemeCache", {})
+    if not cache_config.get("enable", True):
+        return None
+    if PHONEME_CACHE is None:
+        PHONEME_CACHE = PhonemeCache(int(cache_config.get("maxEntries", 5000)),
+                                     cache_config.get("file", "cache/phonemes.json") if cache_config.get(
+                                         "persist", True) else "",
+                                     cache_config.get("names", []))
+    return PHONEME_CACHE
+
+
+def export_debug_wav(config, name, audio, sample_rate):
+    """
+    Writes intermediate audio into the debug export directory (if configured)
+    :param config: the global config
+    :param name: file name without extension
+    :param audio: float32 samples
+    :param sample_rate: the sample rate
+    """
+    export_dir = config["tts"].get("debugExportDirectory", "")
+    if not export_dir:
+        return
+    try:
+        os.makedirs(export_dir, exist_ok=True)
+        sf.write(join(export_dir, name + ".wav"), audio, samplerate=sample_rate)
+    except Exception as e:
+        print("[!] Unable to export debug audio", name, e)
+
+
+def split_sentences(payload):
+    """
+    Splits a payload into sentence-sized chunks that can be phonemized independently
+    :param payload: the text
+    :return: list of non-empty chunks
+    """
+    return [chunk for chunk in SENTENCE_END_PATTERN.split(payload.strip()) if chunk.strip()]
+
+
+def iter_phonemes(voice, payload, phoneme_cache=None):
+    """
+    Phonemizes the payload chunk by chunk, so the first sentence is available without waiting for the rest
+    :param voice: the piper voice
+    :param payload: the text
+    :param phoneme_cache: optional PhonemeCache
+    :return: generator of phoneme lists (one per sentence)
+    """
+    for chunk in split_sentences(payload):
+        with metrics.timer("phonemize"):
+            if phoneme_cache is not None:
+                phonemes = phoneme_cache.phonemize(voice, chunk)
+            else:
+                phonemes = voice.phonemize(chunk)
+        yield from phonemes
+
+
+def plan_short_utterances(sentences, min_phoneme_count, mode):
+    """
+    Prepares sentences for models that are unstable on short inputs (modelConfig minPhonemeCount).
+    Modes (modelConfig shortUtteranceMode):
+    * repeat: repeat the sentence until the minimum is reached and keep the first repetition (legacy, expensive)
+    * pad: append word-boundary phonemes (near zero duration) and trim the trailing silence afterward (default)
+    * group: merge consecutive short sentences of the payload into one inference, pad what remains short.
+      Cheapest, but the merged sentences come back as one chunk: no sentence silence between them, playback waits
+      for the whole group and the audio cache stores the group, not the sentences
+    :param sentences: iterable of phoneme lists
+    :param min_phoneme_count: the minimum phoneme count
+    :param mode: repeat, pad or group
+    :return: generator of (phonemes to synthesize, n_repetitions, padded)
+    """
+    def finish(phonemes):
+        if len(phonemes) >= min_phoneme_count:
+            return phonemes, 1, False
+        if mode == "repeat":
+            n_repetitions = int(math.ceil(1.0 * min_phoneme_count / len(phonemes)))
+            print("[i] Min phoneme count", min_phoneme_count, "not reached. Repeating", "".join(phonemes), "x",
+                  n_repetitions)
+            return (phonemes + [";", ",", " "]) * n_repetitions, n_repetitions, False
+        print("[i] Min phoneme count", min_phoneme_count, "not reached. Padding", "".join(phonemes))
+        return phonemes + [SHORT_UTTERANCE_PADDING] * (min_phoneme_count - len(phonemes)), 1, True
 
-PIPER_VOICE_CACHE = {}
-
-
-def run_piper(config, payload, model, language, speaker, temp_dir, file_name_template):
-    model_file = os.path.abspath("piper/models/" + model + "_" + language + ".onnx")
-    config_file = os.path.abspath("piper/models/" + model + "_" + language + ".json")
+    pending = []
+    for phonemes in sentences:
+        if len(phonemes) <= 0:
+            continue
+        if mode != "group":
+            yield finish(phonemes)
+            continue
+        pending = pending + [" "] + phonemes if pending else list(phonemes)
+        if len(pending) >= min_phoneme_count:
+            yield finish(pending)
+            pending = []
+    if pending:
+        yield finish(pending)
+
+
+def trim_padding(wav_bytes, sample_rate, sentence_silence):
+    """
+    Removes the trailing silence produced by padding phonemes and restores the regular sentence silence
+    :param wav_bytes: raw 16-bit audio
+    :param sample_rate: the sample rate
+    :param sentence_silence: silence (seconds) to append
+    :return: raw 16-bit audio
+    """
+    samples = np.frombuffer(wav_bytes, dtype=np.int16)
+    voiced = np.flatnonzero(np.abs(samples) > SILENCE_THRESHOLD)
+    end = min(len(samples), voiced[-1] + 1 + int(0.05 * sample_rate)) if len(voiced) else len(samples)
+    return samples[:end].tobytes() + bytes(int(sentence_silence * sample_rate) * 2)
+
+
+def iter_batches(items, batch_size):
+    """
+    Groups items into batches. The first batch always has a single item, so the first sentence is not delayed.
+    :param items: iterable
+    :param batch_size: maximum batch size
+    :return: generator of lists
+    """
+    batch = []
+    limit = 1
+    for item in items:
+        batch.append(item)
+        if len(batch) >= limit:
+            yield batch
+            batch = []
+            limit = max(1, batch_size)
+    if batch:
+        yield batch
+
+
+def synthesize_batch(voice, sentences, speaker_id, noise_scale=None, sentence_silence=0.0):
+    """
+    Synthesizes several phoneme sequences with a single ONNX session call (padded to the longest sequence).
+    Piper models do not output the audio length per item, so the padded tail of each item is cut
+    where its audio falls silent.
+    :param voice: the piper voice
+    :param sentences: list of phoneme lists
+    :param speaker_id: the speaker id
+    :param noise_scale: noise scale (None for the model default)
+    :param sentence_silence: silence (seconds) appended to each item
+    :return: list of raw 16-bit audio per sentence
+    """
+    voice_config = voice.config
+    phoneme_ids = [voice.phonemes_to_ids(sentence) for sentence in sentences]
+    pad_id = voice_config.phoneme_id_map["_"][0]
+    ids_array = np.full((len(phoneme_ids), max(len(ids) for ids in phoneme_ids)), pad_id, dtype=np.int64)
+    for row, ids in enumerate(phoneme_ids):
+        ids_array[row, :len(ids)] = ids
+    ids_lengths = np.array([len(ids) for ids in phoneme_ids], dtype=np.int64)
+    scales = np.array([voice_config.noise_scale if noise_scale is None else noise_scale,
+                       voice_config.length_scale, voice_config.noise_w], dtype=np.float32)
+    sid = np.full(len(phoneme_ids), speaker_id, dtype=np.int64) if voice_config.num_speakers > 1 else None
+
+    audio = voice.session.run(None, {"input": ids_array, "input_lengths": ids_lengths, "scales": scales,
+                                     "sid": sid})[0]
+    audio = audio.reshape(len(phoneme_ids), -1)
+    silence = bytes(int(sentence_silence * voice_config.sample_rate) * 2)
+
+    results = []
+    for row in audio:
+        peak = max(0.01, float(np.max(np.abs(row))))
+        voiced = np.flatnonzero(np.abs(row) > peak * 0.01)
+        if len(voiced):
+            row = row[:voiced[-1] + 1]
+        samples = np.clip(row * (32767 / peak), -32767, 32767).astype(np.int16)
+        results.append(samples.tobytes() + silence)
+    return results
+
+
+def run_piper(config, payload, model, language, speaker, export_prefix="", is_cancelled=None):
+    """
+    Synthesizes the payload sentence by sentence
+    :param config: the global config
+    :param payload: the text
+    :param model: the piper model name
+    :param language: the model language
+    :param speaker: the speaker id
+    :param export_prefix: prefix for debug exports
+    :param is_cancelled: optional function; synthesis stops before the next inference once it returns True
+    :return: generator of (float32 samples, sample rate) per sentence
+    """
+    model_file = PIPER_MODELS.files(model, language)[0]
     voice_config = {}
     model_lang = model + "_" + language
 
     if model_lang in config["tts"]["modelConfig"]:
         voice_config = config["tts"]["modelConfig"][model_lang]
-    with open(config_file, "r", encoding='utf-8') as f:
-        model_config = json.load(f)
-
-    start = time.time()
-
-    if model_file in PIPER_VOICE_CACHE:
-        voice = PIPER_VOICE_CACHE[model_file]
-    else:
-        from piper import PiperVoice
-        voice = PiperVoice.load(model_file, config_path=config_file, use_cuda=False)
-        PIPER_VOICE_CACHE[model_file] = voice
 
-    end = time.time()
-    print("[i] TTS model load took", end - start, "seconds")
+    with metrics.timer("model_fetch", model=model_lang):
+        voice = PIPER_MODELS.get(model, language)
 
-    start = time.time()
-    phonemes = voice.phonemize(payload)
-    end = time.time()
-    print("[i] TTS phonemes took", end - start, "seconds")
+    audio_cache = get_audio_cache(config)
+    model_stat = os.stat(model_file)
 
-    for index, sentence_ in enumerate(phonemes):
-        min_phoneme_count = voice_config["minPhonemeCount"] if "minPhonemeCount" in voice_config else 0
-        noise_scale = None
-
-        if len(sentence_) <= 0:
-            continue
-        if len(sentence_) >= min_phoneme_count:
-            sentence = sentence_
-            n_repetitions = 1
-        else:
-            n_repetitions = int(math.ceil(1.0 * min_phoneme_count / len(sentence_)))
-            print("[i] Min phoneme count", min_phoneme_count, "not reached. Repeating", "".join(sentence_), "x",
-                  n_repetitions)
-            sentence = (sentence_ + [";", ",", " "]) * n_repetitions
-            if "phonemeCountFixNoiseScale" in voice_config:
-                noise_scale = voice_config["phonemeCountFixNoiseScale"]
-
-        synthesize_args = {
-            "phoneme_input": True,
-            "speaker_id": int(speaker),
-            "length_scale": None,
-            "noise_scale": noise_scale,
-            "noise_w": None,
-            "sentence_silence": 0.2,
-        }
-        print("[i] TTS >", "".join(sentence))
+    min_phoneme_count = voice_config["minPhonemeCount"] if "minPhonemeCount" in voice_config else 0
+    short_utterance_mode = voice_config.get("shortUtteranceMode", "pad")
+    sample_rate = voice.config.sample_rate
+    batch_size = int(config["tts"].get("batchSize", 4)) if config["tts"].get("batchInference", False) else 1
+    phoneme_cache = get_phoneme_cache(config)
+    sentences = plan_short_utterances(iter_phonemes(voice, payload, phoneme_cache), min_phoneme_count,
+                                      short_utterance_mode)
 
+    for batch in iter_batches(enumerate(sentences), batch_size):
+        if is_cancelled is not None and is_cancelled():
+            return
         start = time.time()
-        wav_bytes = b"".join(list(voice.synthesize_stream_raw("".join(sentence), **synthesize_args)))
-        if n_repetitions > 1:
-            width = int(len(wav_bytes) / n_repetitions)
-            wav_bytes = wav_bytes[:width]
-
-        bytes_io = io.BytesIO(wav_bytes)
-        segment = AudioSegment.from_raw(bytes_io, frame_rate=model_config["audio"]["sample_rate"], sample_width=2,
-                                        channels=1)
-
-        wav_file = join(temp_dir, file_name_template + str(index) + ".wav")
-        try:
-            new_segment = segment.fade_out(100) + AudioSegment.silent(duration=150)
-            new_segment.export(wav_file, format="wav")
-        except:
-            new_segment = segment + AudioSegment.silent(duration=150)
-            new_segment.export(wav_file, format="wav")
-
-        end = time.time()
-        print("[i] TTS generate sentence", index, "took", end - start, "seconds")
-        yield wav_file
-
-
-def tts_post_process(config, input_wav, temp_dir, index):
-    output_wav = input_wav
+        items = []
+        for index, (sentence, n_repetitions, padded) in batch:
+            noise_scale = None
+            if (n_repetitions > 1 or padded) and "phonemeCountFixNoiseScale" in voice_config:
+                noise_scale = voice_config["phonemeCountFixNoiseScale"]
 
+            synthesize_args = {
+                "phoneme_input": True,
+                "speaker_id": int(speaker),
+                "length_scale": None,
+                "noise_scale": noise_scale,
+                "noise_w": None,
+                "sentence_silence": 0.2,
+            }
+            print("[i] TTS >", "".join(sentence))
+
+            item = {"index": index, "sentence": sentence, "n_repetitions": n_repetitions, "padded": padded,
+                    "args": synthesize_args, "cache_key": None, "wav_bytes": None}
+            if audio_cache is not None:
+                item["cache_key"] = make_cache_key(model=model_lang, model_size=model_stat.st_size,
+                                                   model_mtime=model_stat.st_mtime, speaker=str(speaker),
+                                                   phonemes="".join(sentence), n_repetitions=n_repetitions,
+                                                   padded=padded, **synthesize_args)
+                item["wav_bytes"] = audio_cache.get(item["cache_key"])
+                if item["wav_bytes"] is not None:
+                    print("[i] TTS sentence", index, "served from audio cache")
+                    metrics.increment("audio_cache_hits")
+                else:
+                    metrics.increment("audio_cache_misses")
+            item["cached"] = item["wav_bytes"] is not None
+            items.append(item)
+
+        # Batch the cache misses that share the synthesis parameters (repeated sentences are synthesized alone)
+        batchable = [item for item in items if not item["cached"] and item["n_repetitions"] == 1]
+        for noise_scale in set(item["args"]["noise_scale"] for item in batchable):
+            group = [item for item in batchable if item["args"]["noise_scale"] == noise_scale]
+            if len(group) < 2:
+                continue
+            try:
+                with metrics.timer("inference", model=model_lang, sentences=len(group)):
+                    wavs = synthesize_batch(voice, [item["sentence"] for item in group], int(speaker), noise_scale,
+                                            group[0]["args"]["sentence_silence"])
+                for item, wav_bytes in zip(group, wavs):
+                    item["wav_bytes"] = wav_bytes
+            except Exception as e:
+                print("[!] Batch inference failed, falling back to single sentences", e)
+
+        for item in items:
+            index = item["index"]
+            n_repetitions = item["n_repetitions"]
+            wav_bytes = item["wav_bytes"]
+            if not item["cached"]:
+                if wav_bytes is None:
+                    with metrics.timer("inference", model=model_lang, sentences=1):
+                        wav_bytes = b"".join(list(voice.synthesize_stream_raw("".join(item["sentence"]),
+                                                                              **item["args"])))
+                    if n_repetitions > 1:
+                        width = int(len(wav_bytes) / n_repetitions) // 2 * 2
+                        wav_bytes = wav_bytes[:width]
+                if item["padded"]:
+                    wav_bytes = trim_padding(wav_bytes, sample_rate, item["args"]["sentence_silence"])
+                if audio_cache is not None:
+                    audio_cache.put(item["cache_key"], wav_bytes)
+
+            audio = assemble_sentence(wav_bytes, sample_rate, fade_duration=0.1, silence_duration=0.15)
+            export_debug_wav(config, export_prefix + "piper_" + str(index), audio, sample_rate)
+
+            metrics.record("sentence", time.time() - start, model=model_lang, cached=item["cached"])
+            metrics.increment("audio_seconds", len(audio) / sample_rate, model=model_lang)
+            yield audio, sample_rate
+
+    if audio_cache is not None:
+        stats = audio_cache.stats()
+        print("[i] Audio cache:", stats["hits"], "hits,", stats["misses"], "misses,", stats["entries"], "entries")
+    if phoneme_cache is not None:
+        stats = phoneme_cache.stats()
+        print("[i] Phoneme cache:", round(stats["hitRate"] * 100), "% hits,", stats["entries"], "entries,",
+              round(stats["timeSaved"] * 1000), "ms saved")
+
+
+def tts_post_process(config, audio, sample_rate, index, export_prefix="", voice=None):
+    """
+    Applies the configured post-processing to a sentence
+    :param config: the global config
+    :param audio: float32 samples
+    :param sample_rate: the sample rate
+    :param index: the sentence index
+    :param export_prefix: prefix for debug exports
+    :param voice: the voice (model, language, speaker) used for the noise profile and the calibrated loudness gain
+    :return: float32 samples
+    """
     if config["tts"]["enableNoiseReduce"]:
         try:
             import noisereduce as nr
-            audio = AudioSegment.from_file(output_wav)
-            samples = np.array(audio.get_array_of_samples())
-
-            reduced_noise = nr.reduce_noise(y=samples, sr=audio.frame_rate,
-                                            prop_decrease=config["tts"]["noiseReduceFactor"])
-            segment = AudioSegment(reduced_noise.tobytes(), frame_rate=audio.frame_rate,
-                                   sample_width=audio.sample_width,
-                                   channels=audio.channels)
-
-            output_wav = join(temp_dir, f"noisereduce_output_{index}.wav")
-            segment.export(output_wav, format="wav")
+            noise_profile = get_noise_profile(config, voice)
+            if noise_profile is not None:
+                # Stationary reduction against the cached noise floor of the voice (see noise_profile.py)
+                audio = nr.reduce_noise(y=audio, sr=sample_rate, y_noise=noise_profile, stationary=True,
+                                        prop_decrease=config["tts"]["noiseReduceFactor"]).astype(np.float32)
+            else:
+                audio = nr.reduce_noise(y=audio, sr=sample_rate,
+                                        prop_decrease=config["tts"]["noiseReduceFactor"]).astype(np.float32)
+            export_debug_wav(config, export_prefix + f"noisereduce_output_{index}", audio, sample_rate)
         except Exception as e:
             print("[!] Error during noise reduction", e)
 
@@ -134,21 +380,37 @@ def tts_post_process(config, input_wav, temp_dir, index):
 
     if config["tts"]["enableLoudnessNormalization"]:
         try:
-            import pyloudnorm as pyln
-            input_wav = output_wav
-            output_wav = join(temp_dir, f"normalized_output_{index}.wav")
-            data, rate = sf.read(input_wav)
-            meter = pyln.Meter(rate)  # create BS.1770 meter
-            loudness = meter.integrated_loudness(data)
-            loudness_normalized_audio = pyln.normalize.loudness(data, loudness,
-                                                                config["tts"][
-                                                                    "loudnessNormalizationTarget"])
-            sf.write(output_wav, loudness_normalized_audio, samplerate=rate)
-
+            gain = get_loudness_gain(config, voice)
+            if gain is not None:
+                # Calibrated voice (see loudness.py): a scalar gain instead of measuring every sentence
+                audio = audio * np.float32(gain)
+            else:
+                import pyloudnorm as pyln
+                meter = pyln.Meter(sample_rate)  # create BS.1770 meter
+                loudness = meter.integrated_loudness(audio)
+                audio = pyln.normalize.loudness(audio, loudness,
+                                                config["tts"]["loudnessNormalizationTarget"]).astype(np.float32)
+            if config["tts"].get("enableLimiter", True):
+                audio = apply_limiter(audio, sample_rate, config["tts"].get("limiterThreshold", 0.9))
+            export_debug_wav(config, export_prefix + f"normalized_output_{index}", audio, sample_rate)
         except Exception as e:
             print("[!] Error during loudness normalization", e)
 
-    return output_wav
+    return audio
+
+
+def get_player(config):
+    """
+    :param config: the global config
+    :return: the long-lived player of the configured output device (reopened if the device changed)
+    """
+    global PLAYER, PLAYER_KEY
+    if PLAYER is None or PLAYER_KEY != player_key(config):
+        if PLAYER is not None:
+            PLAYER.close()
+        PLAYER = create_player(config, lambda: config["volume"])
+        PLAYER_KEY = player_key(config)
+    return PLAYER
 
 
 def tts_simple(config, payload, npc_id, full_name):
@@ -158,40 +420,21 @@ def tts_simple(config, payload, npc_id, full_name):
         print("[!] No voice found. Cancelling!")
         return
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        def generate_audio(audio_queue):
-            piper_generator = run_piper(config, payload, voice["model"], voice["language"],
-                                        voice["speaker"], temp_dir, "piper")
-            for index, piper_wav_file in enumerate(piper_generator):
-                print("[i] Received sentence", index, "-->", piper_wav_file)
-                output_wav = tts_post_process(config, piper_wav_file, temp_dir, index)
-                audio_queue.put(output_wav)
-            audio_queue.put(None)
-
-        def play_audio(audio_queue):
-            while True:
-                if not audio_queue.empty():
-                    wav_file = audio_queue.get()
-
-                    # Break condition
-                    if wav_file is None:
-                        break
-
-                    wav_data, sample_rate = sf.read(wav_file)
-                    sd.play(wav_data * config["volume"], samplerate=sample_rate, blocking=True)
-                else:
-                    time.sleep(0.1)  # Sleep briefly to avoid busy waiting
-
-        audio_queue = queue.Queue()
-        generate_thread = threading.Thread(target=generate_audio, args=(audio_queue,))
-        generate_thread.start()
-
-        audio_thread = threading.Thread(target=play_audio, args=(audio_queue,))
-        audio_thread.start()
+    export_prefix = uuid.uuid4().hex[:8] + "_"
+    if config["tts"]["enableNoiseReduce"]:
+        ensure_noise_profile(config, voice)
 
-        # Wait for the processing thread to finish
-        generate_thread.join()
-        audio_thread.join()
+    # Sentences are written into the player as they are synthesized; playback continues while the next one is
+    # synthesized and the volume is read live from the config
+    player = get_player(config)
+    end = 0.0
+    piper_generator = run_piper(config, payload, voice["model"], voice["language"], voice["speaker"], export_prefix)
+    for index, (audio, sample_rate) in enumerate(piper_generator):
+        print("[i] Received sentence", index, "-->", round(len(audio) / sample_rate, 2), "seconds")
+        with metrics.timer("post_process"):
+            audio = tts_post_process(config, audio, sample_rate, index, export_prefix, voice)
+        _, end = player.write(audio, sample_rate)
+    player.wait(end)
 
 
 # def tts_voicefixer_whole(config, piper_wav_file, temp_dir):
@@ -208,20 +451,11 @@ def tts_simple(config, payload, npc_id, full_name):
 
 
 def tts_init(config):
+    get_audio_cache(config)
+    get_phoneme_cache(config)
     print("[i] Pre-caching TTS voices ...")
-    for lang in ["de", "fr", "en", "jp"]:
-        if lang in config["voices"]:
-            for voice in config["voices"][lang]:
-                model = voice["model"]
-                language = voice["language"]
-                model_file = os.path.abspath("piper/models/" + model + "_" + language + ".onnx")
-                config_file = os.path.abspath("piper/models/" + model + "_" + language + ".json")
-
-                if model_file not in PIPER_VOICE_CACHE:
-                    print("[i] Pre-caching TTS voices ...", model + "_" + language)
-                    from piper import PiperVoice
-                    tts_model = PiperVoice.load(model_file, config_path=config_file, use_cuda=False)
-                    PIPER_VOICE_CACHE[model_file] = tts_model
+    PIPER_MODELS.configure(config)
+    PIPER_MODELS.preload(config)
 
     # if config["tts"]["enableVoiceFixer"]:
     #     import voicefixer
@@ -0,0 +1,124 @@
+import json
+import os
+import statistics
+import sys
+import time
+
+from config import read_config
+from loudness import REFERENCE_TEXTS
+from models import SESSION_TUNING_FILE, load_piper_voice, machine_id, model_files, warm_up
+
+REPETITIONS = 5
+
+
+def thread_candidates(max_threads):
+    candidates = [1]
+    while candidates[-1] * 2 <= max_threads:
+        candidates.append(candidates[-1] * 2)
+    if candidates[-1] != max_threads:
+        candidates.append(max_threads)
+    return candidates
+
+
+def benchmark(model_file, config_file, settings, sentences):
+    """
+    Loads the model with the given session settings and measures the synthesis of the sentences
+    :param model_file: the ONNX file
+    :param config_file: the json config file
+    :param settings: session settings (see models.session_options)
+    :param sentences: phoneme strings
+    :return: median synthesis time in seconds
+    """
+    voice = load_piper_voice(model_file, config_file, settings)
+    warm_up(voice)
+    times = []
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        for sentence in sentences:
+            for _ in voice.synthesize_stream_raw(sentence, phoneme_input=True, sentence_silence=0.0):
+                pass
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def tune_model(model, language, max_threads):
+    """
+    Sweeps the session settings one at a time (threads, execution mode, optimization level, memory arena),
+    keeping the fastest value of each before moving on to the next
+    :param model: the model name
+    :param language: the model language
+    :param max_threads: maximum number of intra-op threads
+    :return: the fastest settings (with their "time")
+    """
+    model_file, config_file = model_files(model, language)
+    voice = load_piper_voice(model_file, config_file)
+    text = REFERENCE_TEXTS.get(language, REFERENCE_TEXTS["en"])
+    sentences = ["".join(phonemes) for phonemes in voice.phonemize(text)]
+
+    best = {"intraOpThreads": 1, "interOpThreads": 1, "executionMode": "sequential",
+            "graphOptimizationLevel": "all", "enableMemArena": True}
+    best_time = None
+    sweeps = [
+        [{"intraOpThreads": threads} for threads in thread_candidates(max_threads)],
+        [{"executionMode": "sequential", "interOpThreads": 1},
+         {"executionMode": "parallel", "interOpThreads": min(2, max_threads)}],
+        [{"graphOptimizationLevel": level} for level in ["basic", "extended", "all"]],
+        [{"enableMemArena": enabled} for enabled in [True, False]],
+    ]
+    for sweep in sweeps:
+        sweep_best = None
+        for change in sweep:
+            settings = dict(best, **change)
+            duration = benchmark(model_file, config_file, settings, sentences)
+            print("[i]", model + "_" + language, json.dumps(change), "-->", round(duration * 1000, 1), "ms")
+            if sweep_best is None or duration < sweep_best[1]:
+                sweep_best = (settings, duration)
+        best, best_time = sweep_best
+    return dict(best, time=best_time)
+
+
+def main():
+    """
+    Finds the fastest ONNX Runtime session settings of each model on this machine and records them
+    in cache/session_tuning.json (picked up by the model manager; tts.modelConfig still overrides them).
+    By default, at most half of the CPU cores are used, so the game keeps the rest.
+    Usage (from the repository root): python lfffxivtts/tune.py [--max-threads N] [model_lang ...]
+    """
+    args = sys.argv[1:]
+    max_threads = max(1, (os.cpu_count() or 2) // 2)
+    if "--max-threads" in args:
+        position = args.index("--max-threads")
+        max_threads = int(args[position + 1])
+        del args[position:position + 2]
+
+    config = read_config()
+    tuning_file = config["tts"].get("models", {}).get("sessionTuningFile", SESSION_TUNING_FILE)
+    model_langs = args
+    if not model_langs:
+        languages = [config["language"]] if config["language"] in config["voices"] else list(config["voices"])
+        model_langs = sorted(set(voice["model"] + "_" + voice["language"]
+                                 for lang in languages for voice in config["voices"][lang]))
+
+    tuning = {"machine": machine_id(), "models": {}}
+    if os.path.exists(tuning_file):
+        with open(tuning_file, "r") as f:
+            previous = json.load(f)
+        if previous.get("machine") == tuning["machine"]:
+            tuning = previous
+
+    for model_lang in model_langs:
+        model, language = model_lang.rsplit("_", 1)
+        try:
+            tuning["models"][model_lang] = tune_model(model, language, max_threads)
+            print("[i] Fastest settings for", model_lang, json.dumps(tuning["models"][model_lang]))
+        except Exception as e:
+            print("[!] Unable to tune", model_lang, e)
+
+    os.makedirs(os.path.dirname(tuning_file) or ".", exist_ok=True)
+    with open(tuning_file, "w") as f:
+        json.dump(tuning, f, indent=4)
+    print("[i] Session tuning written to", tuning_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,74 @@
 import re
 import random
-import traceback
+import zlib
+
+NAME_PATTERN = re.compile(r"[^a-zA-Z ]")
+TRIE_END = ""
+
+
+def normalize_name(name):
+    return NAME_PATTERN.sub("", name).lower()
+
+
+def stable_hash(text):
+    """
+    Hash that (unlike hash()) does not change between runs
+    :param text: the text
+    :return: non-negative int
+    """
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class VoiceIndex:
+    """
+    Lookup structures for select_voice, built once when the config is loaded
+    * a prefix trie over the special character names (characters.json)
+    * voices per (language, gender)
+    * normalized NPC name -> NPC id (binary search in the NPC database)
+    """
+
+    def __init__(self, config):
+        self.char_trie = {}
+        for order, char_name in enumerate(config["chars"]):
+            node = self.char_trie
+            for c in char_name:
+                node = node.setdefault(c, {})
+            node.setdefault(TRIE_END, (order, char_name))
+
+        self.voices_by_gender = {}
+        for lang, voices in config["voices"].items():
+            for voice in voices:
+                self.voices_by_gender.setdefault((lang, voice["gender"]), []).append(voice)
+
+        self.npcs = config["npcs"]
+
+    def match_character(self, normalized_name):
+        """
+        Finds the first character (in characters.json order) that is a prefix of any name segment
+        :param normalized_name: name as returned by normalize_name
+        :return: character name or None
+        """
+        best = None
+        for segment in normalized_name.split(" "):
+            node = self.char_trie
+            for c in segment:
+                node = node.get(c)
+                if node is None:
+                    break
+                if TRIE_END in node and (best is None or node[TRIE_END] < best):
+                    best = node[TRIE_END]
+        return best[1] if best is not None else None
+
+    def voices(self, lang, gender):
+        return self.voices_by_gender.get((lang, gender), [])
+
+    def find_npc_by_name(self, normalized_name):
+        return self.npcs.find_by_name(normalized_name)
+
+
+def build_voice_index(config):
+    config["voice_index"] = VoiceIndex(config)
+    print("[i] --> Built voice index")
 
 
 def select_voice(config, npc_id, full_name, lang):
@@ -17,81 +85,76 @@ def select_voice(config, npc_id, full_name, lang):
         lang = "en"
     npc_id = str(npc_id)
     print("[i] Select voice query", npc_id, "+", full_name)
+    if "voice_index" not in config:
+        build_voice_index(config)
+    index = config["voice_index"]
 
     # Look for a known NPC
     if npc_id and npc_id in config["npcs"]:
         npc = config["npcs"][npc_id]
 
         # Known character?
-        npc_name = re.sub(r"[^a-zA-Z ]", "", npc["name"]).lower()
-        for char_name in config["chars"]:
-            for segment in npc_name.split(" "):
-                if segment.startswith(char_name):
-                    print("[i] Selecting by NPC", npc_id, "name matched to character", char_name)
-                    return config["chars"][char_name]["tts"][lang]
+        char_name = index.match_character(normalize_name(npc["name"]))
+        if char_name is not None:
+            print("[i] Selecting by NPC", npc_id, "name matched to character", char_name)
+            return config["chars"][char_name]["tts"][lang]
 
         # Select by ID (filter by gender)
-        available_voices = [voice for voice in config["voices"][lang] if voice["gender"] == npc["gender"]]
-        voice = available_voices[int(npc_id) % len(available_voices)]
-        print("[i] Selecting NPC voice for", npc_id, "-->", voice["name"])
-        return voice
+        available_voices = index.voices(lang, npc["gender"])
+        if available_voices:
+            voice = available_voices[int(npc_id) % len(available_voices)]
+            print("[i] Selecting NPC voice for", npc_id, "-->", voice["name"])
+            return voice
 
     # Known character by name?
     if full_name.strip():
-        npc_name = re.sub(r"[^a-zA-Z ]", "", full_name).lower()
-        for char_name in config["chars"]:
-            for segment in npc_name.split(" "):
-                if segment.startswith(char_name):
-                    print("[i] Selecting by NPC name", npc_id, "name matched to character", char_name)
-                    return config["chars"][char_name]["tts"][lang]
-
-    # Use gender associated from NPC db
-    if npc_id and npc_id in config["npcs"]:
-        try:
-            npc = config["npcs"][npc_id]
-            gender = npc["gender"]
-            if gender is not None:
-                available_voices = [voice for voice in config["voices"][lang] if voice["gender"] == gender]
-                id_num = int(npc_id)
-                voice = available_voices[id_num % len(config["voices"][lang])]
-                print("[w] Using NPC gender voice", voice["name"], "for", npc_id)
+        npc_name = normalize_name(full_name)
+        char_name = index.match_character(npc_name)
+        if char_name is not None:
+            print("[i] Selecting by NPC name", npc_id, "name matched to character", char_name)
+            return config["chars"][char_name]["tts"][lang]
+
+        # Known NPC by name? (use its gender)
+        npc_id_by_name = index.find_npc_by_name(npc_name)
+        if npc_id_by_name is not None:
+            available_voices = index.voices(lang, config["npcs"][npc_id_by_name]["gender"])
+            if available_voices:
+                voice = available_voices[int(npc_id_by_name) % len(available_voices)]
+                print("[i] Selecting by NPC name", full_name, "matched to NPC", npc_id_by_name, "-->", voice["name"])
                 return voice
-        except Exception as e:
-            print("[!] Error at select_voice / 3", e)
-            traceback.print_exc()
 
     # Use the gender list
     if full_name.strip():
-        first_name = re.sub(r"[^a-zA-Z ]", "", full_name.split(" ")[0]).lower()
+        first_name = normalize_name(full_name.split(" ")[0])
         if first_name in config["genders"]:
             gender = config["genders"][first_name]
 
             if gender is not None:
-                # Select by ID (filter by gender)
-                available_voices = [voice for voice in config["voices"][lang] if voice["gender"] == gender]
-                npc_id = hash(full_name)
-                voice = available_voices[int(npc_id) % len(available_voices)]
-                print("[i] Selecting NPC voice via gender list", "-->", gender)
-                return voice
+                # Select by name hash (filter by gender)
+                available_voices = index.voices(lang, gender)
+                if available_voices:
+                    voice = available_voices[stable_hash(full_name) % len(available_voices)]
+                    print("[i] Selecting NPC voice via gender list", "-->", gender)
+                    return voice
 
     # Use pattern (from race, based on name)
     if full_name:
         for race in ["hyur", "elezen", "lalafell", "miqo'te", "roegadyn", "au ra"]:
             gender = estimate_gender_by_name(full_name, race)
             if gender is not None:
-                # Select by ID (filter by gender)
-                available_voices = [voice for voice in config["voices"][lang] if voice["gender"] == gender]
-                npc_id = hash(full_name)
-                voice = available_voices[int(npc_id) % len(available_voices)]
-                print("[i] Selecting voice via gender pattern", "-->", gender, "name", full_name)
-                return voice
-
+                # Select by name hash (filter by gender)
+                available_voices = index.voices(lang, gender)
+                if available_voices:
+                    voice = available_voices[stable_hash(full_name) % len(available_voices)]
+                    print("[i] Selecting voice via gender pattern", "-->", gender, "name", full_name)
+                    return voice
 
     # Fallback by gender (CLI)
-    for voice in config["voices"][lang]:
-        if voice["gender"] == full_name:
-            print("[w] Using gender fallback voice", full_name, voice["name"])
-            return voice
+    available_voices = index.voices(lang, full_name)
+    if available_voices:
+        voice = available_voices[0]
+        print("[w] Using gender fallback voice", full_name, voice["name"])
+        return voice
 
     # Select any (CLI)
     if npc_id == "any":
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath("lfffxivtts"))
+
+from dsp import assemble_sentence, crossfade_concat, fade_in, float32_to_int16, int16_to_float32, resample
+
+SAMPLE_RATE = 22050
+
+
+def test_assemble_sentence_fades_out_and_appends_silence():
+    samples = np.full(SAMPLE_RATE, 16384, dtype=np.int16)
+    audio = assemble_sentence(samples.tobytes(), SAMPLE_RATE, fade_duration=0.1, silence_duration=0.15)
+    fade = int(0.1 * SAMPLE_RATE)
+
+    assert audio.dtype == np.float32
+    assert len(audio) == SAMPLE_RATE + int(0.15 * SAMPLE_RATE)
+    assert np.all(audio[:SAMPLE_RATE - fade] == 0.5)
+    # Linear fade from the full level to zero
+    faded = audio[SAMPLE_RATE - fade:SAMPLE_RATE]
+    assert faded[0] == 0.5 and faded[-1] == 0.0
+    assert np.all(np.diff(faded) <= 0)
+    assert np.allclose(faded, np.linspace(0.5, 0.0, fade), atol=1e-6)
+    assert np.all(audio[SAMPLE_RATE:] == 0.0)
+
+
+def test_assemble_sentence_with_audio_shorter_than_the_fade():
+    audio = assemble_sentence(np.full(10, 1000, dtype=np.int16).tobytes(), SAMPLE_RATE, fade_duration=0.1,
+                              silence_duration=0.0)
+    assert len(audio) == 10
+    assert audio[0] == np.float32(1000 / 32768) and audio[-1] == 0.0
+
+
+def test_fade_in_is_the_reverse_of_the_fade_out():
+    audio = fade_in(np.ones(100, dtype=np.float32), 1000, 0.05)
+    assert audio[0] == 0.0 and audio[49] == 1.0 and np.all(audio[50:] == 1.0)
+
+
+def test_int16_round_trip_clips():
+    samples = np.array([-32768, -1, 0, 1, 32767], dtype=np.int16)
+    assert np.array_equal(float32_to_int16(int16_to_float32(samples)), samples)
+    assert np.array_equal(float32_to_int16(np.array([-2.0, 2.0], dtype=np.float32)), [-32768, 32767])
+
+
+def test_resample_lengths():
+    audio = np.sin(np.arange(SAMPLE_RATE, dtype=np.float32) / 10)
+    assert resample(audio, SAMPLE_RATE, SAMPLE_RATE) is audio
+    for target_rate in [16000, 44100, 48000]:
+        resampled = resample(audio, SAMPLE_RATE, target_rate)
+        assert resampled.dtype == np.float32
+        assert len(resampled) == target_rate
+    assert len(resample(audio[:441], 44100, 48000)) == 480
+    assert len(resample(np.zeros(0, dtype=np.float32), SAMPLE_RATE, 48000)) == 0
+    # Linear interpolation keeps a constant signal constant
+    assert np.allclose(resample(np.full(1000, 0.25, dtype=np.float32), SAMPLE_RATE, 48000), 0.25)
+
+
+def test_crossfade_concat_overlaps_consecutive_chunks():
+    chunks = [np.ones(100, dtype=np.float32), np.zeros(100, dtype=np.float32)]
+    out = crossfade_concat(chunks, 1000, 0.01)
+    assert len(out) == 190
+    assert np.all(out[:90] == 1.0) and np.all(out[100:] == 0.0)
+    assert np.allclose(out[90:100], np.linspace(1.0, 0.0, 10))
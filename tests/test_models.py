@@ -0,0 +1,83 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath("lfffxivtts"))
+
+import models
+from config import read_config
+
+
+def fake_models(monkeypatch, tmp_path, size):
+    def model_files(model, language, variant=""):
+        model_file = tmp_path / (model + "_" + language + ".onnx")
+        if not model_file.exists():
+            with open(model_file, "wb") as f:
+                f.truncate(size)
+        return str(model_file), str(tmp_path / (model + "_" + language + ".json"))
+
+    monkeypatch.setattr(models, "model_files", model_files)
+    monkeypatch.setattr(models, "load_piper_voice", lambda *args, **kwargs: object())
+
+
+def preloaded(config):
+    manager = models.ModelManager()
+    manager.configure(config)
+    manager.warm_up = False
+    manager.preload(config, wait=True)
+    return sorted(manager.models)
+
+
+def test_default_config_preloads_the_models_of_every_language(monkeypatch, tmp_path):
+    config = read_config()
+    assert config["language"] == "auto" and config["tts"]["models"]["preload"] == "active"
+    fake_models(monkeypatch, tmp_path, 75 * 1024 * 1024)
+    assert preloaded(config) == ["mls_de", "mls_fr", "vctk_en"]
+
+
+def test_preload_stays_within_the_memory_budget(monkeypatch, tmp_path):
+    config = read_config()
+    config["tts"]["models"]["maxMemoryMB"] = 160
+    fake_models(monkeypatch, tmp_path, 75 * 1024 * 1024)
+    assert len(preloaded(config)) == 2
+
+
+def test_configured_language_preloads_its_models_only(monkeypatch, tmp_path):
+    config = read_config()
+    config["language"] = "fr"
+    fake_models(monkeypatch, tmp_path, 75 * 1024 * 1024)
+    assert preloaded(config) == ["mls_fr"]
+
+
+def test_calibration_and_noise_profile_keys_follow_the_model_variant(monkeypatch, tmp_path):
+    import loudness
+    import noise_profile
+    monkeypatch.setattr(models, "model_files", lambda model, language, variant="": (
+        str(tmp_path / (model + "_" + language + ("." + variant if variant else "") + ".onnx")),
+        str(tmp_path / (model + "_" + language + ".json"))))
+    config = {"tts": {"modelConfig": {"mls_de": {"variant": "int8"}}, "noiseProfileDirectory": str(tmp_path)}}
+    voice = {"model": "mls", "language": "de", "speaker": 3}
+    # The variant was not created (quantize.py), so the original model and its keys are used
+    assert models.model_variant(config["tts"]["modelConfig"], "mls", "de") == ""
+    assert loudness.voice_key(config, voice) == "mls_de/3"
+    assert os.path.basename(noise_profile.profile_file(config, voice)) == "mls_de_3.npy"
+
+    (tmp_path / "mls_de.int8.onnx").touch()
+    assert models.model_variant(config["tts"]["modelConfig"], "mls", "de") == "int8"
+    assert loudness.voice_key(config, voice) == "mls_de.int8/3"
+    assert os.path.basename(noise_profile.profile_file(config, voice)) == "mls_de.int8_3.npy"
+
+
+def test_progress_is_not_ready_before_preload(monkeypatch, tmp_path):
+    config = read_config()
+    fake_models(monkeypatch, tmp_path, 1024)
+    manager = models.ModelManager()
+    manager.configure(config)
+    manager.warm_up = False
+    assert not manager.progress()["ready"]
+    manager.preload(config, wait=True)
+    assert manager.progress() == {"loaded": 3, "total": 3, "ready": True}
+
+    config["tts"]["models"]["preload"] = "none"
+    manager = models.ModelManager()
+    manager.preload(config)
+    assert manager.progress()["ready"]
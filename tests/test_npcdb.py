@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath("lfffxivtts"))
+
+import config
+from npcdb import NpcDatabase, convert_npcs
+from voice import normalize_name
+
+NPCS = {
+    "1008177": {"npc_id": 1008177, "name": "Tataru", "race": "lalafell", "gender": "female", "clan": "dunesfolk"},
+    "1000080": {"npc_id": 1000080, "name": "", "race": "hyur", "gender": "male", "clan": "midlander"},
+    "1009001": {"npc_id": 1009001, "name": "Alphinaud", "race": "elezen", "gender": "male", "clan": "wildwood"},
+    "1001002": {"npc_id": 1001002, "name": "Ul'dahn Guard", "race": "hyur", "gender": "male", "clan": "highlander"},
+    "1001001": {"npc_id": 1001001, "name": "Ul'dahn Guard", "race": "roegadyn", "gender": "male",
+                "clan": "sea wolf"},
+}
+
+
+def write_npcs(path, npcs):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(npcs, f)
+
+
+def test_lookups_round_trip(tmp_path):
+    write_npcs(tmp_path / "npcs.json", NPCS)
+    convert_npcs(str(tmp_path / "npcs.json"), str(tmp_path / "npcs.bin"))
+    db = NpcDatabase(str(tmp_path / "npcs.bin"))
+
+    assert len(db) == len(NPCS)
+    for npc_id, npc in NPCS.items():
+        assert npc_id in db and int(npc_id) in db
+        assert db[npc_id] == npc
+    assert dict(db.items()) == NPCS
+    assert "42" not in db and "abc" not in db and None not in db
+    assert db.get("42", "missing") == "missing"
+
+    assert db.find_by_name(normalize_name("Tataru")) == "1008177"
+    assert db.find_by_name(normalize_name("ALPHINAUD")) == "1009001"
+    # Several NPCs share the name: the lowest id wins
+    assert db.find_by_name(normalize_name("Ul'dahn Guard")) == "1001001"
+    assert db.find_by_name(normalize_name("Unknown")) is None
+    assert db.find_by_name("") is None
+
+
+def test_read_npcs_converts_a_stale_database_into_the_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("lfffxivtts/resources")
+    write_npcs(config.NPCS_JSON_FILE, {"1008177": NPCS["1008177"]})
+    convert_npcs(config.NPCS_JSON_FILE, "lfffxivtts/resources/npcs.bin")
+    # The shipped database is up to date
+    settings = {}
+    config.read_npcs(settings)
+    assert settings["npcs"].path == "lfffxivtts/resources/npcs.bin"
+
+    # npcs.json changed after the shipped database was built -> converted into the cache
+    write_npcs(config.NPCS_JSON_FILE, NPCS)
+    changed = os.path.getmtime(config.NPCS_JSON_FILE)
+    os.utime("lfffxivtts/resources/npcs.bin", (changed - 10, changed - 10))
+    config.read_npcs(settings)
+    assert settings["npcs"].path == "cache/npcs.bin"
+    assert len(settings["npcs"]) == len(NPCS)
+
+    # The cached conversion is reused while it is newer than npcs.json
+    cached = os.path.getmtime("cache/npcs.bin")
+    config.read_npcs(settings)
+    assert os.path.getmtime("cache/npcs.bin") == cached
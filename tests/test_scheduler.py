@@ -0,0 +1,85 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath("lfffxivtts"))
+
+import client
+from scheduler import DialogueScheduler
+
+
+class FakeAudioCommands:
+    """
+    Stands in for the audio worker: an utterance is finished as soon as its end command arrives
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def put(self, command):
+        self.commands.append(command)
+        if command["type"] == "end":
+            client.SCHEDULER.finished(command["utterance"])
+
+
+def test_failed_synthesis_keeps_the_queue_draining(monkeypatch):
+    config = {"enable": True, "language": "en", "outputDeviceIndex": -1,
+              "dialogue": {"mode": "queue", "queueSize": 10, "lookahead": 1},
+              "tts": {"enableNoiseReduce": False}}
+    attempts = []
+
+    def failing_run_piper(*args, **kwargs):
+        attempts.append(args[1])
+        raise FileNotFoundError("model missing")
+
+    monkeypatch.setattr(client, "start_audio_worker", lambda: None)
+    monkeypatch.setattr(client, "select_voice", lambda *args: {"model": "vctk", "language": "en", "speaker": 0})
+    monkeypatch.setattr(client, "run_piper", failing_run_piper)
+    monkeypatch.setattr(client, "AUDIO_COMMANDS", FakeAudioCommands())
+    monkeypatch.setattr(client, "CANCEL_GENERATION", multiprocessing.Value("i", 0))
+
+    async def run():
+        monkeypatch.setattr(client, "SCHEDULER", DialogueScheduler(config, client.tts_cancel))
+        for index in range(5):
+            client.SCHEDULER.submit({"Type": "Say", "Payload": "Line " + str(index), "Speaker": "Guard", "NpcId": 0})
+        task = asyncio.create_task(client.start_tts(config))
+        for _ in range(100):
+            if len(attempts) == 5:
+                break
+            await asyncio.sleep(0.02)
+        task.cancel()
+
+    asyncio.run(run())
+    assert len(attempts) == 5
+    assert not client.SCHEDULER.pending
+    assert client.SCHEDULER.ahead() == 0
+
+
+def test_cancel_during_voice_selection_cancels_the_line(monkeypatch):
+    config = {"enable": True, "language": "en", "outputDeviceIndex": -1,
+              "dialogue": {"mode": "queue", "queueSize": 10, "lookahead": 1},
+              "tts": {"enableNoiseReduce": False}}
+
+    def select_voice_then_cancel(*args):
+        # A Cancel message handled while the synthesis thread selects the voice
+        client.SCHEDULER.cancel_all()
+        return {"model": "vctk", "language": "en", "speaker": 0}
+
+    def run_piper(*args, **kwargs):
+        yield [0.0] * 100, 22050
+
+    audio_commands = FakeAudioCommands()
+    monkeypatch.setattr(client, "start_audio_worker", lambda: None)
+    monkeypatch.setattr(client, "select_voice", select_voice_then_cancel)
+    monkeypatch.setattr(client, "run_piper", run_piper)
+    monkeypatch.setattr(client, "AUDIO_COMMANDS", audio_commands)
+    monkeypatch.setattr(client, "CANCEL_GENERATION", multiprocessing.Value("i", 0))
+    monkeypatch.setattr(client, "CANCEL_TIME", multiprocessing.Value("d", 0.0))
+    monkeypatch.setattr(client, "SCHEDULER", DialogueScheduler(config, client.tts_cancel))
+
+    generation, utterance = client.dispatch()
+    assert client.SCHEDULER.ahead() == 1
+    client.tts_say(config, {"Payload": "Hello.", "Speaker": "Guard", "NpcId": 0}, generation, utterance)
+    assert [command["type"] for command in audio_commands.commands] == ["begin", "end"]
+    assert client.SCHEDULER.ahead() == 0